@@ -1 +1,11 @@
-from . import ion_event_counting, ion_integration, tis_camera
+import importlib
+
+__all__ = ["benchmark", "ion_event_counting", "ion_integration", "tis_camera", "tof"]
+
+
+def __getattr__(name):
+    # subpackages are imported on first access so importing one of them does
+    # not pay for the dependencies of all the others
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
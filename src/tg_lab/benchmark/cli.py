@@ -0,0 +1,143 @@
+import os
+import shutil
+import sys
+from dataclasses import dataclass, field
+
+import numpy as np
+import polars as pl
+import tyro
+
+from tg_lab.benchmark import harness, synthetic
+
+
+@dataclass
+class BenchmarkConfig:
+    """
+    Benchmarks event counting and ion integration on synthetic VMI data
+    """
+
+    output_dir: str
+    """directory to write the results and synthetic data to"""
+
+    shape: tuple[int, int] = (1080, 1440)
+    """(rows, cols) of the synthetic sensor"""
+
+    num_frames: int = 20
+    """number of synthetic camera frames"""
+
+    density: float = 1e-4
+    """mean number of ion hits per pixel and frame"""
+
+    nxnareas: list[int] = field(default_factory=lambda: [3, 5, 7])
+    """event counting peak neighbourhood sizes to benchmark"""
+
+    thresholds: list[float] = field(default_factory=lambda: [50, 70])
+    """event counting thresholds to benchmark"""
+
+    radii: list[float] = field(default_factory=lambda: [4, 8, 16])
+    """ion spot radii of the synthetic accumulated images to benchmark"""
+
+    num_ions: list[int] = field(default_factory=lambda: [50, 5000])
+    """numbers of ion spots in the synthetic accumulated images to benchmark"""
+
+    repeat: int = 3
+    """number of timed runs per case, the fastest is reported"""
+
+    write_data: bool = False
+    """write the frames as bmp and the accumulated images as csv, and benchmark
+    `process_images_in_folder` on the frames"""
+
+    seed: int = 0
+    """seed of the synthetic data"""
+
+    baseline: str | None = None
+    """baseline json to compare the results with"""
+
+    save_baseline: str | None = None
+    """path to save the results to as a new baseline"""
+
+    tolerance: float = 0.2
+    """fractional throughput loss or memory growth counted as a regression"""
+
+
+def entry_point(config: BenchmarkConfig) -> pl.DataFrame:
+    os.makedirs(config.output_dir, exist_ok=True)
+    rng = np.random.default_rng(config.seed)
+
+    rows = []
+    if config.write_data:
+        # the folder benchmark forks worker processes, so it runs first
+        frame_dir = os.path.join(config.output_dir, "frames")
+        # frames of an earlier run with another count or shape would be
+        # processed as well
+        shutil.rmtree(frame_dir, ignore_errors=True)
+        frame_paths = synthetic.write_frames(
+            frame_dir,
+            config.num_frames,
+            rng=rng,
+            shape=config.shape,
+            density=config.density,
+        )
+        rows += harness.bench_process_folder(frame_dir, frame_paths)
+
+    print(f"    > event counting on {config.num_frames} frames")
+    frames = [
+        synthetic.make_frame(config.shape, density=config.density, rng=rng)[0]
+        for _ in range(config.num_frames)
+    ]
+    rows += harness.bench_event_counting(
+        frames, config.nxnareas, config.thresholds, repeat=config.repeat
+    )
+
+    for num_ions in config.num_ions:
+        print(f"    > ion integration of {num_ions} ions")
+        images = {}
+        for radius in config.radii:
+            images[radius] = synthetic.make_accumulated_image(
+                config.shape, num_ions=num_ions, radius=radius, rng=rng
+            )
+            if config.write_data:
+                synthetic.write_image(
+                    os.path.join(
+                        config.output_dir, f"accumulated_n{num_ions}_r{radius:g}.csv"
+                    ),
+                    images[radius][0],
+                )
+        rows += harness.bench_ion_signals(
+            images, repeat=config.repeat, max_sigma=max(config.radii)
+        )
+
+    results = harness.to_frame(rows)
+    results.write_csv(os.path.join(config.output_dir, "benchmark.csv"))
+    with pl.Config(tbl_rows=-1, tbl_cols=-1):
+        print(results.drop("unit"))
+
+    if config.save_baseline is not None:
+        harness.save_baseline(results, config.save_baseline)
+        print(f"    > baseline saved to {config.save_baseline}")
+
+    if config.baseline is not None:
+        comparison = harness.compare(
+            results, harness.load_baseline(config.baseline), config.tolerance
+        )
+        with pl.Config(tbl_rows=-1, tbl_cols=-1):
+            print(
+                comparison.select(
+                    *harness.KEY_COLS, "speedup", "memory_ratio", "regression"
+                )
+            )
+        num_regressions = comparison["regression"].sum()
+        print(f"    > {num_regressions} regressions against {config.baseline}")
+        if num_regressions:
+            sys.exit(1)
+
+    return results
+
+
+def main():
+    config = tyro.cli(BenchmarkConfig)
+    entry_point(config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import json
+import platform
+import time
+import tracemalloc
+from functools import partial
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import polars as pl
+
+# columns identifying a benchmark case, results are compared on these
+KEY_COLS = [
+    "benchmark",
+    "nxnarea",
+    "threshold",
+    "radius",
+    "num_ions",
+    "integration_fn",
+]
+
+_schema = {
+    "benchmark": pl.String,
+    "nxnarea": pl.Int64,
+    "threshold": pl.Float64,
+    "radius": pl.Float64,
+    "num_ions": pl.Int64,
+    "integration_fn": pl.String,
+    "unit": pl.String,
+    "items": pl.Int64,
+    "seconds": pl.Float64,
+    "items_per_s": pl.Float64,
+    "peak_bytes": pl.Int64,
+}
+
+
+def measure(fn: Callable, repeat: int = 3) -> tuple[float, int, object]:
+    """
+    Best wall time of `repeat` calls of `fn` and the peak memory of one call
+
+    The peak is the largest growth of the memory traced by `tracemalloc`,
+    it covers python and numpy allocations, not memory numba compiled
+    functions allocate internally. The timed calls run without tracing.
+
+    Returns:
+        (tuple[float, int, object]): seconds, peak bytes and the last result
+    """
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = fn()
+        best = min(best, time.perf_counter() - t0)
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = tracemalloc.get_traced_memory()[0]
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] - start
+    if not tracing:
+        tracemalloc.stop()
+
+    return best, peak, res
+
+
+def _row(benchmark, unit, items, seconds, peak, **params):
+    return {
+        "benchmark": benchmark,
+        **{k: params.get(k) for k in KEY_COLS[1:]},
+        "unit": unit,
+        "items": items,
+        "seconds": seconds,
+        "items_per_s": items / seconds if seconds > 0 else np.inf,
+        "peak_bytes": peak,
+    }
+
+
+def bench_event_counting(
+    frames: list[np.array],
+    nxnareas: list[int] = [3, 5, 7],
+    thresholds: list[float] = [50, 70],
+    mode: int = 5,
+    multiply_factor: int = 5,
+    int_offset: int = 10,
+    repeat: int = 3,
+) -> list[dict]:
+    """
+    Frames/sec of `event_counting` over every frame for a grid of peak
+    neighbourhood sizes and thresholds
+    """
+    from tg_lab.ion_event_counting.fastvimprocess import event_counting
+
+    frames = [f.astype(np.int64) for f in frames]
+    # compile outside of the timed region
+    event_counting(frames[0], thresholds[0], mode, nxnareas[0], multiply_factor, 0)
+
+    rows = []
+    for nxnarea in nxnareas:
+        for threshold in thresholds:
+
+            def run():
+                return sum(
+                    event_counting(
+                        f, threshold, mode, nxnarea, multiply_factor, int_offset
+                    )[1]
+                    for f in frames
+                )
+
+            seconds, peak, _ = measure(run, repeat=repeat)
+            rows.append(
+                _row(
+                    "event_counting",
+                    "frames",
+                    len(frames),
+                    seconds,
+                    peak,
+                    nxnarea=nxnarea,
+                    threshold=threshold,
+                )
+            )
+    return rows
+
+
+def bench_process_folder(
+    folder: str | Path, frames: list[Path], repeat: int = 1
+) -> list[dict]:
+    """
+    Frames/sec of `process_images_in_folder` on a folder of BMP frames,
+    including decoding and the process pool
+
+    Args:
+        folder: folder holding only the benchmark frames, every BMP in it is
+            processed
+        frames: paths of the frames, as returned by `synthetic.write_frames`
+        repeat: number of timed calls, the best is reported
+    """
+    from tg_lab.ion_event_counting.fastvimprocess import process_images_in_folder
+
+    num_frames = len(frames)
+    seconds, peak, _ = measure(lambda: process_images_in_folder(folder), repeat)
+    return [_row("process_images_in_folder", "frames", num_frames, seconds, peak)]
+
+
+def bench_ion_signals(
+    images: dict[float, tuple[np.array, np.array]],
+    integration_fns: list | None = None,
+    repeat: int = 3,
+    **kwargs,
+) -> list[dict]:
+    """
+    Blobs/sec of the ion integration for accumulated images of several spot
+    radii: `get_ion_signals` (detection and integration), `integrate_blobs`
+    on the true blobs, and the per-blob `_integrate_box`/`_integrate_norm`
+    loop it replaces as the baseline. Cases are keyed by radius and number of
+    ions, `integrate_blobs` only builds a summed-area table once there are
+    enough ions to pay for it.
+
+    Args:
+        images: spot radius -> (image, true blobs) as made by
+            `synthetic.make_accumulated_image`
+        integration_fns: integration functions to benchmark, defaults to all
+        repeat: number of timed calls, the best is reported
+        kwargs: keyword arguments for `get_ion_signals`
+    """
+    import tg_lab.ion_integration.compute as ipc
+
+    integration_fns = (
+        list(ipc.IntegrationFns) if integration_fns is None else integration_fns
+    )
+    per_blob = {
+        ipc.IntegrationFns.BOX: ipc._integrate_box,
+        ipc.IntegrationFns.L1: partial(ipc._integrate_norm, ord=1),
+        ipc.IntegrationFns.L2: partial(ipc._integrate_norm, ord=2),
+    }
+
+    rows = []
+    for radius, (image, blobs) in images.items():
+        seconds, peak, res = measure(
+            lambda: ipc.get_ion_signals(image, integration_fns, **kwargs), repeat
+        )
+        rows.append(
+            _row(
+                "get_ion_signals",
+                "blobs",
+                res.height,
+                seconds,
+                peak,
+                radius=radius,
+                num_ions=len(blobs),
+            )
+        )
+
+        for fn in integration_fns:
+            seconds, peak, _ = measure(
+                lambda: ipc.integrate_blobs(image, blobs, [fn], None), repeat
+            )
+            rows.append(
+                _row(
+                    "integrate_blobs",
+                    "blobs",
+                    len(blobs),
+                    seconds,
+                    peak,
+                    radius=radius,
+                    num_ions=len(blobs),
+                    integration_fn=fn.value,
+                )
+            )
+
+            centers = np.rint(blobs[:, :2]).astype(int)
+
+            def run():
+                return [
+                    per_blob[fn](image, row, col, radius) for row, col in centers
+                ]
+
+            seconds, peak, _ = measure(run, repeat)
+            rows.append(
+                _row(
+                    "integrate_per_blob",
+                    "blobs",
+                    len(blobs),
+                    seconds,
+                    peak,
+                    radius=radius,
+                    num_ions=len(blobs),
+                    integration_fn=fn.value,
+                )
+            )
+    return rows
+
+
+def to_frame(rows: list[dict]) -> pl.DataFrame:
+    return pl.DataFrame(rows, schema=_schema)
+
+
+def save_baseline(results: pl.DataFrame, path: str | Path):
+    """
+    Write results as a json baseline together with a description of the host
+    """
+    baseline = {
+        "host": {
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "python": platform.python_version(),
+        },
+        "results": results.to_dicts(),
+    }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=4)
+
+
+def load_baseline(path: str | Path) -> pl.DataFrame:
+    with open(path) as f:
+        return pl.DataFrame(json.load(f)["results"], schema=_schema)
+
+
+def compare(
+    results: pl.DataFrame,
+    baseline: pl.DataFrame,
+    tolerance: float = 0.2,
+    min_bytes: int = 2**20,
+) -> pl.DataFrame:
+    """
+    Throughput and peak memory of every case relative to a baseline
+
+    A case regresses when its throughput drops by more than `tolerance` or
+    its peak memory grows by more than `tolerance`, as a fraction of the
+    baseline. Peaks below `min_bytes` are too noisy to count as regressions.
+    Cases missing from the baseline are left out.
+
+    Returns:
+        (pl.DataFrame): cases with `speedup`, `memory_ratio` and `regression`
+    """
+    return (
+        results.join(
+            baseline.select(*KEY_COLS, "items_per_s", "peak_bytes"),
+            on=KEY_COLS,
+            how="inner",
+            suffix="_baseline",
+            nulls_equal=True,
+        )
+        .with_columns(
+            (pl.col("items_per_s") / pl.col("items_per_s_baseline")).alias("speedup"),
+            (pl.col("peak_bytes") / pl.col("peak_bytes_baseline")).alias(
+                "memory_ratio"
+            ),
+        )
+        .with_columns(
+            (
+                (pl.col("speedup") < 1 - tolerance)
+                | (
+                    (pl.col("memory_ratio") > 1 + tolerance)
+                    & (pl.col("peak_bytes") > min_bytes)
+                )
+            ).alias("regression")
+        )
+    )
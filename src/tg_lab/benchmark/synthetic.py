@@ -0,0 +1,184 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+def ring_positions(
+    num: int,
+    shape: tuple[int, int],
+    rings: tuple[float, ...] = (0.25, 0.5, 0.75),
+    ring_width: float = 0.03,
+    rng: np.random.Generator | None = None,
+) -> np.array:
+    """
+    Positions scattered around concentric rings like the momentum shells of a
+    velocity map image
+
+    Args:
+        num: number of positions
+        shape: (rows, cols) of the sensor
+        rings: ring radii as fractions of half the smaller sensor side
+        ring_width: standard deviation of the radii in the same units
+        rng: random generator
+
+    Returns:
+        (np.array): (num, 2) float row and column positions inside the sensor
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    center = np.array(shape) / 2
+    scale = min(shape) / 2
+
+    radius = rng.choice(rings, size=num) + rng.normal(0, ring_width, size=num)
+    angle = rng.uniform(0, 2 * np.pi, size=num)
+    pos = center + scale * np.stack(
+        [radius * np.sin(angle), radius * np.cos(angle)], axis=1
+    )
+    return np.clip(pos, 0, np.array(shape) - 1)
+
+
+def render_spots(
+    shape: tuple[int, int],
+    positions: np.array,
+    sigma: float | np.ndarray,
+    amplitude: float | np.ndarray,
+) -> np.array:
+    """
+    Sum of gaussian spots, each rendered only within 4 sigma of its center
+
+    Returns:
+        (np.array): float64 image
+    """
+    image = np.zeros(shape)
+    sigma = np.broadcast_to(sigma, len(positions))
+    amplitude = np.broadcast_to(amplitude, len(positions))
+
+    for (row, col), s, a in zip(positions, sigma, amplitude):
+        r = int(np.ceil(4 * s))
+        lrow, hrow = max(int(row) - r, 0), min(int(row) + r + 1, shape[0])
+        lcol, hcol = max(int(col) - r, 0), min(int(col) + r + 1, shape[1])
+        y = np.arange(lrow, hrow)[:, None] - row
+        x = np.arange(lcol, hcol)[None, :] - col
+        image[lrow:hrow, lcol:hcol] += a * np.exp(-(x * x + y * y) / (2 * s * s))
+
+    return image
+
+
+def make_frame(
+    shape: tuple[int, int] = (1080, 1440),
+    density: float = 1e-4,
+    spot_sigma: float = 1.0,
+    spot_amplitude: float = 120,
+    offset: float = 10,
+    noise: float = 3,
+    rng: np.random.Generator | None = None,
+) -> tuple[np.array, np.array]:
+    """
+    Single camera frame of isolated ion hits on a noisy dark level
+
+    The number of hits is poisson distributed with a mean of
+    `density * rows * cols`, their amplitudes are exponentially distributed
+    around `spot_amplitude` like MCP pulse heights.
+
+    Args:
+        shape: (rows, cols) of the sensor
+        density: mean number of hits per pixel
+        spot_sigma: gaussian width of a hit in pixels
+        spot_amplitude: mean peak value of a hit above the dark level
+        offset: dark level
+        noise: standard deviation of the gaussian read noise
+        rng: random generator
+
+    Returns:
+        (tuple[np.array, np.array]): the uint8 frame and the (N, 2) hit positions
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    num = rng.poisson(density * shape[0] * shape[1])
+    positions = ring_positions(num, shape, rng=rng)
+    amplitude = rng.exponential(spot_amplitude, size=num)
+
+    frame = offset + rng.normal(0, noise, size=shape)
+    frame += render_spots(shape, positions, spot_sigma, amplitude)
+    return np.clip(np.rint(frame), 0, 255).astype(np.uint8), positions
+
+
+def make_accumulated_image(
+    shape: tuple[int, int] = (1080, 1440),
+    num_ions: int = 50,
+    radius: float = 8,
+    counts: float = 500,
+    background: float = 2,
+    rng: np.random.Generator | None = None,
+) -> tuple[np.array, np.array]:
+    """
+    Accumulated event count image of separated ion spots on a poisson
+    background, the input `get_ion_signals` expects
+
+    Spots are placed on a jittered grid so they do not overlap.
+
+    Args:
+        shape: (rows, cols) of the image
+        num_ions: number of ion spots
+        radius: approximate spot radius in pixels, 2 sigma of the spot
+        counts: mean peak count of a spot
+        background: mean background count per pixel
+        rng: random generator
+
+    Returns:
+        (tuple[np.array, np.array]): the float64 count image and the (N, 3) true
+            row, column and radius of every spot
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    margin = 3 * radius
+    per_row = int(np.ceil(np.sqrt(num_ions * shape[1] / shape[0])))
+    per_col = int(np.ceil(num_ions / per_row))
+    rows = np.linspace(margin, shape[0] - margin, per_col)
+    cols = np.linspace(margin, shape[1] - margin, per_row)
+    grid = np.stack(np.meshgrid(rows, cols, indexing="ij"), axis=-1).reshape(-1, 2)
+    positions = grid[:num_ions] + rng.uniform(-radius / 2, radius / 2, (num_ions, 2))
+
+    rate = background + render_spots(shape, positions, radius / 2, counts)
+    # float64 like the images the loaders parse from csv
+    image = rng.poisson(rate).astype(np.float64)
+    blobs = np.column_stack([positions, np.full(num_ions, radius)])
+    return image, blobs
+
+
+def write_frames(
+    folder: str | Path,
+    num_frames: int,
+    rng: np.random.Generator | None = None,
+    **kwargs,
+) -> list[Path]:
+    """
+    Write synthetic frames as 8 bit BMP files, the input of
+    `process_images_in_folder`
+
+    Args:
+        folder: directory to write to, created if missing
+        num_frames: number of frames
+        rng: random generator
+        kwargs: keyword arguments for `make_frame`
+
+    Returns:
+        (list[Path]): paths of the written frames
+    """
+    from PIL import Image
+
+    rng = np.random.default_rng() if rng is None else rng
+    os.makedirs(folder, exist_ok=True)
+
+    paths = []
+    for i in range(num_frames):
+        frame, _ = make_frame(rng=rng, **kwargs)
+        path = Path(folder) / f"frame_{i:05d}.bmp"
+        Image.fromarray(frame).save(path)
+        paths.append(path)
+    return paths
+
+
+def write_image(path: str | Path, image: np.array):
+    """
+    Write an accumulated image as an integer csv like `save_array_to_csv`
+    """
+    np.savetxt(path, image, delimiter=",", fmt="%d")
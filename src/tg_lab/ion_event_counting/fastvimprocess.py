@@ -1,16 +1,14 @@
 import concurrent.futures
 import os
 import time
+from functools import partial
 
-import matplotlib.colors as mcolors
-import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.colors import TwoSlopeNorm
 from numba import jit
-from PIL import Image
 
 
-@jit(nopython=True)
+# nogil lets concurrent camera pipelines count events on separate cores
+@jit(nopython=True, nogil=True)
 def event_counting(
     input_buffer, threshold, mode, nxnarea, multiply_factor, int_offset, event_size=1
 ):
@@ -48,7 +46,85 @@ def event_counting(
     return event_count, N
 
 
+# nogil lets concurrent camera pipelines count events on separate cores
+@jit(nopython=True, nogil=True)
+def event_centroiding(
+    input_buffer, threshold, mode, nxnarea, multiply_factor, int_offset, upsample, out
+):
+    """
+    Event detection of `event_counting` with sub-pixel positions
+
+    Every event is placed at the intensity weighted centroid of its nxn
+    neighbourhood, weighted by the offset subtracted values above zero, and
+    its value is added to the bin of an `upsample` times finer grid that
+    contains the centroid. Events without positive weights, possible with a
+    threshold <= 0, are placed at the center of their peak pixel. Events are
+    accumulated into `out` in place, which must have the shape of the input
+    times `upsample`.
+
+    Returns:
+        (int): number of events found
+    """
+    maxrow, maxcol = input_buffer.shape
+    out_rows, out_cols = out.shape
+    N = 0
+
+    half_nxn = nxnarea // 2
+
+    for y in range(half_nxn, maxrow - half_nxn):
+        for x in range(half_nxn, maxcol - half_nxn):
+            value = input_buffer[y, x] - int_offset
+            if value >= threshold:
+                is_peak = True
+                for dy in range(-half_nxn, half_nxn + 1):
+                    for dx in range(-half_nxn, half_nxn + 1):
+                        if (dy, dx) != (0, 0) and input_buffer[
+                            y + dy, x + dx
+                        ] - int_offset > value:
+                            is_peak = False
+                            break
+                    if not is_peak:
+                        break
+
+                if is_peak:
+                    total = 0.0
+                    row_moment = 0.0
+                    col_moment = 0.0
+                    for dy in range(-half_nxn, half_nxn + 1):
+                        for dx in range(-half_nxn, half_nxn + 1):
+                            w = input_buffer[y + dy, x + dx] - int_offset
+                            if w > 0:
+                                total += w
+                                row_moment += w * dy
+                                col_moment += w * dx
+
+                    # a threshold <= 0 admits peaks without positive weights,
+                    # those stay at the center of their peak pixel
+                    row_offset = 0.0
+                    col_offset = 0.0
+                    if total > 0:
+                        row_offset = row_moment / total
+                        col_offset = col_moment / total
+
+                    # pixel y covers [y - 0.5, y + 0.5), which maps to the bins
+                    # [y * upsample, (y + 1) * upsample) of the finer grid
+                    row = int((y + row_offset + 0.5) * upsample)
+                    col = int((x + col_offset + 0.5) * upsample)
+                    row = min(max(row, 0), out_rows - 1)
+                    col = min(max(col, 0), out_cols - 1)
+
+                    adjusted_value = (
+                        value * multiply_factor if mode >= 10 else multiply_factor
+                    )
+                    out[row, col] += adjusted_value
+                    N += 1
+
+    return N
+
+
 def image_to_array(image_path):
+    from PIL import Image
+
     try:
         with Image.open(image_path) as img:
             img = img.convert("L")
@@ -58,10 +134,12 @@ def image_to_array(image_path):
 
 
 def array_to_img(array):
+    from PIL import Image
+
     return Image.fromarray(np.uint8(array))
 
 
-def process_single_image(file_path):
+def process_single_image(file_path, upsample=1):
     threshold = 70
     mode = 5
     nxnarea = 5
@@ -70,15 +148,40 @@ def process_single_image(file_path):
     current_image_array, error = image_to_array(file_path)
     if error:
         return None, error
-    event_map, num_events = event_counting(
-        current_image_array, threshold, mode, nxnarea, multiply_factor, int_offset
-    )
+    if upsample > 1:
+        event_map = np.zeros(
+            (
+                current_image_array.shape[0] * upsample,
+                current_image_array.shape[1] * upsample,
+            ),
+            dtype=np.int32,
+        )
+        num_events = event_centroiding(
+            current_image_array,
+            threshold,
+            mode,
+            nxnarea,
+            multiply_factor,
+            int_offset,
+            upsample,
+            event_map,
+        )
+    else:
+        event_map, num_events = event_counting(
+            current_image_array, threshold, mode, nxnarea, multiply_factor, int_offset
+        )
     print("num_events:", num_events)
     # result_image = array_to_img(event_map * 255)
     return event_map, None
 
 
-def process_images_in_folder(folder_path):
+def process_images_in_folder(folder_path, upsample=1):
+    """
+    Count the events of every `.bmp` image in a folder and sum the event maps
+
+    With `upsample` > 1 events are placed at their sub-pixel centroids on a
+    grid `upsample` times finer than the images, see `event_centroiding`
+    """
     all_files = [
         os.path.join(root, file)
         for root, _, files in os.walk(folder_path)
@@ -91,7 +194,8 @@ def process_images_in_folder(folder_path):
     num_images = 0
 
     with concurrent.futures.ProcessPoolExecutor() as executor:
-        for current_array, error in executor.map(process_single_image, all_files):
+        process = partial(process_single_image, upsample=upsample)
+        for current_array, error in executor.map(process, all_files):
             if error:
                 skipped_files += 1
                 continue
@@ -125,6 +229,10 @@ def subtract_arrays(array_a, array_b):
 
 
 if __name__ == "__main__":
+    import matplotlib.colors as mcolors
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import TwoSlopeNorm
+
     time_start = time.time()
     folder_path_a = "D:/Experimental_Data/20240918/VMI-3000V-4.78us-25ns-Opened-MCP1175-15000-1"  # 替换为你的文件夹路径
     folder_path_b = "D:/Experimental_Data/20240918/VMI-3000V-4.78us-25ns-Closed-MCP1175-15000-1"  # 替换为你的文件夹路径
@@ -1 +1 @@
-from . import compute
+from . import cache, compute, loaders
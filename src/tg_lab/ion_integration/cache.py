@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+
+class ResultCache:
+    """
+    On-disk cache of arrays keyed on content hashes
+
+    Every entry is a single `.npy` file. Reading an entry refreshes its
+    modification time, and whenever the cache grows past `max_bytes` the least
+    recently used entries are deleted.
+
+    Args:
+        root: directory holding the cache entries
+        max_bytes: size cap of the cache directory in bytes
+    """
+
+    def __init__(self, root: str | Path, max_bytes: int = 2**31):
+        self.root = Path(root).expanduser()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def hash_file(path: str | Path, chunk_size: int = 2**20) -> str:
+        """
+        sha256 hex digest of a file's content
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(name: str, *parts) -> str:
+        """
+        Cache key of an entry named `name` derived from json serializable parts
+        """
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return f"{name}-{hashlib.sha256(payload.encode()).hexdigest()}"
+
+    def get(self, key: str) -> np.ndarray | None:
+        path = self.root / f"{key}.npy"
+        try:
+            # entries are read into memory, a memory mapped entry could not be
+            # evicted by other processes on windows
+            arr = np.load(path)
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        return arr
+
+    def put(self, key: str, arr: np.ndarray):
+        path = self.root / f"{key}.npy"
+        # write under a unique name and rename so concurrent workers never see
+        # a partially written entry
+        tmp = self.root / f"{key}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, arr)
+        try:
+            os.replace(tmp, path)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            return
+        self.evict()
+
+    def size(self) -> int:
+        return sum(entry.stat().st_size for entry in self.root.glob("*.npy"))
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache fits `max_bytes`
+        """
+        entries = []
+        for entry in self.root.glob("*.npy"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            try:
+                entry.unlink()
+            except OSError:
+                # in use or already removed by another worker
+                continue
+            total -= size
@@ -1,4 +1,10 @@
+import concurrent.futures
+import glob
+import os
+import time
+from collections import Counter, defaultdict
 from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
 
 import numpy as np
@@ -6,6 +12,8 @@ import polars as pl
 import tyro
 
 import tg_lab.ion_integration.compute as ipc
+from tg_lab.ion_integration.cache import ResultCache
+from tg_lab.ion_integration.loaders import load_image, load_stack
 
 
 @dataclass
@@ -15,7 +23,7 @@ class IntegrationConfig:
     """
 
     input_file: str
-    """ion image data file"""
+    """ion image data file, a directory of files or a glob pattern"""
 
     output_dir: str
     """directory to write output to"""
@@ -26,21 +34,267 @@ class IntegrationConfig:
     integration_fns: list[ipc.IntegrationFns]
     """list of integration functions to sum ion image data"""
 
+    background_width: int | None = None
+    """width of the annulus around each ion to estimate local background from"""
+
+    blobs_file: str | None = None
+    """csv with row, col and radius columns (e.g. a previous output) to reuse
+    instead of detecting the ions again"""
+
+    downsample: int = 1
+    """factor to downsample the image by for a coarse ion detection pass"""
+
+    roi: tuple[int, int, int, int] | None = None
+    """(row_min, row_max, col_min, col_max) region to detect ions in"""
+
+    max_sigma: float = 30
+    """largest ion size searched for by the detection"""
+
+    num_sigma: int = 12
+    """number of ion sizes searched for by the detection"""
+
+    report_timings: bool = False
+    """print the duration of every processing stage"""
+
+    input_pattern: str = "*.csv"
+    """pattern of the files to process when input_file is a directory"""
+
+    workers: int | None = None
+    """number of worker processes for multiple files, defaults to every core"""
+
+    per_file_outputs: bool = False
+    """also write an output file per input file next to the combined output"""
+
+    delimiter: str = ","
+    """column delimiter of text input files"""
+
+    cache: bool = False
+    """write a binary .npy cache next to text inputs, which later runs load instead"""
+
+    detect_once: bool = False
+    """detect the ions once on the sum of all input images (or frames of a 3d .npy
+    stack) and integrate the same regions in every image"""
+
+    cache_dir: str | None = None
+    """directory of a persistent cache of parsed images and detected ions keyed on
+    the input content, reruns with other integration settings skip both steps.
+    With detect_once the ions detected on the whole stack are cached"""
+
+    cache_max_mb: float = 2048
+    """size cap of the cache directory, least recently used entries are evicted"""
+
+
+def read_blobs(path: str | Path) -> np.array:
+    return pl.read_csv(path, columns=["row", "col", "radius"]).to_numpy()
+
+
+def get_input_files(input_file: str, pattern: str = "*.csv") -> list[Path]:
+    path = Path(input_file)
+    if path.is_dir():
+        return sorted(path.glob(pattern))
+    if path.exists():
+        return [path]
+    return sorted(Path(p) for p in glob.glob(input_file, recursive=True))
+
+
+def get_output_paths(files: list[Path], path: Path) -> list[Path]:
+    """
+    Per-file output paths next to the combined output `path`
+
+    Every file is named by its path relative to the deepest directory shared
+    by all files, so files with the same name in different directories get
+    different outputs. Names that still collide (the same file name with
+    another extension) are numbered.
+
+    Args:
+        files: input files
+        path: combined output path, its suffix is replaced
+
+    Returns:
+        (list[Path]): one csv path per input file
+    """
+    resolved = [Path(f).resolve() for f in files]
+    root = Path(os.path.commonpath([f.parent for f in resolved]))
+    names = ["_".join(f.relative_to(root).with_suffix("").parts) for f in resolved]
+
+    counts = Counter(names)
+    seen = defaultdict(int)
+    for i, name in enumerate(names):
+        if counts[name] > 1:
+            seen[name] += 1
+            names[i] = f"{name}_{seen[name]}"
+
+    return [path.with_name(f"{path.stem}_{name}.csv") for name in names]
+
+
+def get_detection_kwargs(config: IntegrationConfig) -> dict:
+    return {
+        "downsample": config.downsample,
+        "roi": config.roi,
+        "max_sigma": config.max_sigma,
+        "num_sigma": config.num_sigma,
+    }
+
+
+def get_cache(config: IntegrationConfig) -> ResultCache | None:
+    if config.cache_dir is None:
+        return None
+    return ResultCache(config.cache_dir, int(config.cache_max_mb * 2**20))
 
-def entry_point(config: IntegrationConfig) -> None:
-    with open(config.input_file, "r") as f:
-        data = np.loadtxt(f, delimiter=",")
+
+def make_blobs_key(
+    cache: ResultCache, content_hashes: list[str], config: IntegrationConfig
+) -> str:
+    """
+    Cache key of the ions detected on the inputs with `content_hashes`, the
+    delimiter is part of it as it decides how text inputs are parsed
+    """
+    return cache.make_key(
+        "blobs",
+        content_hashes,
+        config.delimiter,
+        ipc.get_blob_doh_defaults(),
+        get_detection_kwargs(config),
+    )
+
+
+def process_file(
+    path: str | Path, config: IntegrationConfig
+) -> tuple[pl.DataFrame, dict[str, float]]:
+    timings = {}
+
+    cache = get_cache(config)
+    if cache is not None:
+        t0 = time.perf_counter()
+        content_hash = cache.hash_file(path)
+        timings["hash"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    data = None
+    if cache is not None:
+        data_key = cache.make_key("data", content_hash, config.delimiter)
+        data = cache.get(data_key)
+    if data is None:
+        data = load_image(path, delimiter=config.delimiter, cache=config.cache)
+        if cache is not None:
+            cache.put(data_key, data)
+    timings["load"] = time.perf_counter() - t0
+
+    detection_kwargs = get_detection_kwargs(config)
+
+    blobs = None
+    if config.blobs_file is not None:
+        blobs = read_blobs(config.blobs_file)
+    elif cache is not None:
+        blobs_key = make_blobs_key(cache, [content_hash], config)
+        blobs = cache.get(blobs_key)
+        if blobs is None:
+            blobs = ipc.detect_blobs(data, timings=timings, **detection_kwargs)
+            cache.put(blobs_key, blobs)
 
     res: pl.DataFrame = ipc.get_ion_signals(
         data,
         integration_fns=config.integration_fns,
+        background_width=config.background_width,
+        blobs=blobs,
+        timings=timings,
+        **detection_kwargs,
     )
+    return res, timings
+
+
+def process_stack(
+    files: list[Path], config: IntegrationConfig
+) -> tuple[pl.DataFrame, dict[str, float]]:
+    timings = {}
+
+    cache = get_cache(config)
+    if cache is not None:
+        t0 = time.perf_counter()
+        content_hashes = [cache.hash_file(f) for f in files]
+        timings["hash"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    stack, sources = load_stack(files, delimiter=config.delimiter, cache=config.cache)
+    timings["load"] = time.perf_counter() - t0
+
+    detection_kwargs = get_detection_kwargs(config)
+
+    blobs = None
+    if config.blobs_file is not None:
+        blobs = read_blobs(config.blobs_file)
+    elif cache is not None:
+        # the ions of the whole stack are cached, keyed on every input
+        blobs_key = make_blobs_key(cache, content_hashes, config)
+        blobs = cache.get(blobs_key)
+        if blobs is None:
+            t0 = time.perf_counter()
+            reference = stack.sum(axis=0)
+            timings["reference"] = time.perf_counter() - t0
+            blobs = ipc.detect_blobs(reference, timings=timings, **detection_kwargs)
+            cache.put(blobs_key, blobs)
+
+    res: pl.DataFrame = ipc.get_stack_signals(
+        stack,
+        integration_fns=config.integration_fns,
+        background_width=config.background_width,
+        blobs=blobs,
+        timings=timings,
+        **detection_kwargs,
+    )
+    file = pl.Series("file", sources).gather(res["frame"])
+    return res.select(file, pl.all()), timings
+
+
+def entry_point(config: IntegrationConfig) -> None:
+    files = get_input_files(config.input_file, config.input_pattern)
+    if not files:
+        raise FileNotFoundError(f"no input files found for {config.input_file}")
 
     out_dir = Path(config.output_dir).resolve()
     path = out_dir / config.output_target
+
+    if config.detect_once:
+        res, timings = process_stack(files, config)
+        if config.report_timings:
+            for stage, duration in timings.items():
+                print(f"    >{stage}: {duration:.3f} s")
+        res.write_csv(path.with_suffix(".csv"))
+        return
+
+    if len(files) == 1:
+        results = [process_file(files[0], config)]
+    else:
+        # every worker pays the import cost once instead of once per file
+        with concurrent.futures.ProcessPoolExecutor(config.workers) as executor:
+            results = list(
+                executor.map(partial(process_file, config=config), files)
+            )
+
+    combined = []
+    timings = defaultdict(float)
+    output_paths = get_output_paths(files, path)
+    for file, output_path, (res, file_timings) in zip(files, output_paths, results):
+        if config.per_file_outputs:
+            res.write_csv(output_path)
+        combined.append(res.select(pl.lit(str(file)).alias("file"), pl.all()))
+        for stage, duration in file_timings.items():
+            timings[stage] += duration
+
+    if config.report_timings:
+        print(f"    >files: {len(files)}")
+        for stage, duration in timings.items():
+            print(f"    >{stage}: {duration:.3f} s")
+
+    # a single input keeps the original untagged output
+    res = results[0][0] if len(files) == 1 else pl.concat(combined)
     res.write_csv(path.with_suffix(".csv"))
 
 
-if __name__ == "__main__":
+def main():
     config = tyro.cli(IntegrationConfig)
     entry_point(config)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,9 @@
-from collections import defaultdict, deque
+import time
 from enum import Enum
-from functools import partial
+from functools import lru_cache, partial
 
 import numpy as np
 import polars as pl
-from skimage import feature
 
 
 class IntegrationFns(str, Enum):
@@ -16,6 +15,11 @@ class IntegrationFns(str, Enum):
 def get_ion_signals(
     data: np.array,
     integration_fns: list[IntegrationFns] = [IntegrationFns.BOX],
+    background_width: int | None = None,
+    blobs: np.ndarray | None = None,
+    downsample: int = 1,
+    roi: tuple[int, int, int, int] | None = None,
+    timings: dict[str, float] | None = None,
     **kwargs,
 ) -> pl.DataFrame:
     """
@@ -25,35 +29,622 @@ def get_ion_signals(
         data: Ion image data matrix
         integration_fns: List of integration function names to evaluate the
             ion signals with
+        background_width: Width of a square annulus around each ion's box to
+            estimate the local background from, disabled if None
+        blobs: Precomputed (N, 3) array of blob row, column and radius, skips
+            the blob detection if provided
+        downsample: Factor to downsample the image by for a coarse detection
+            pass, see `detect_blobs`
+        roi: (row_min, row_max, col_min, col_max) region to detect blobs in
+        timings: Dictionary to record the duration in seconds of every stage in
         kwargs: Key work arguments for `skimage.feature.blob_doh`, the ion
             position and size identifier
 
     Returns:
         (pl.DataFrame): DataFrame containing the processed ion data
     """
-    blobs = feature.blob_doh(
+    timings = {} if timings is None else timings
+
+    if blobs is None:
+        blobs = detect_blobs(
+            data, downsample=downsample, roi=roi, timings=timings, **kwargs
+        )
+
+    t0 = time.perf_counter()
+    res = integrate_blobs(
         data,
-        min_sigma=1,
-        max_sigma=30,
-        num_sigma=12,
-        threshold_rel=0.5,
-        **kwargs,
+        blobs,
+        integration_fns=integration_fns,
+        background_width=background_width,
+    )
+    timings["integrate"] = time.perf_counter() - t0
+
+    return res
+
+
+def detect_blobs(
+    data: np.array,
+    downsample: int = 1,
+    roi: tuple[int, int, int, int] | None = None,
+    timings: dict[str, float] | None = None,
+    **kwargs,
+) -> np.array:
+    """
+    Identify ion positions and sizes with `skimage.feature.blob_doh`
+
+    With `downsample` > 1 the blobs are first detected on a block averaged
+    image, then every coarse blob is refined by a narrow sigma search in a
+    full resolution window around it.
+
+    Args:
+        data: Ion image data matrix
+        downsample: Integer factor to block average the image by for the
+            coarse detection pass, 1 detects at full resolution
+        roi: (row_min, row_max, col_min, col_max) region to detect blobs in,
+            the returned positions are in full image coordinates
+        timings: Dictionary to record the duration in seconds of every stage in
+        kwargs: Key work arguments for `skimage.feature.blob_doh`
+
+    Returns:
+        (np.array): (N, 3) array of blob row, column and radius
+    """
+    # skimage is only needed when blobs are detected, not for cached or
+    # precomputed blobs
+    from skimage import feature, transform
+
+    timings = {} if timings is None else timings
+    params = {**get_blob_doh_defaults(), **kwargs}
+
+    row_offset, col_offset = 0, 0
+    if roi is not None:
+        row_min, row_max, col_min, col_max = roi
+        data = data[row_min:row_max, col_min:col_max]
+        row_offset, col_offset = row_min, col_min
+
+    t0 = time.perf_counter()
+    if downsample <= 1:
+        blobs = feature.blob_doh(data, **params)
+        timings["detect"] = time.perf_counter() - t0
+    else:
+        coarse = transform.downscale_local_mean(data, (downsample, downsample))
+        coarse_params = {
+            **params,
+            "min_sigma": max(params["min_sigma"] / downsample, 1),
+            "max_sigma": max(params["max_sigma"] / downsample, 1),
+        }
+        blobs = feature.blob_doh(coarse, **coarse_params)
+        # map block coordinates back to the center of the block
+        blobs[:, :2] = blobs[:, :2] * downsample + (downsample - 1) / 2
+        blobs[:, 2] *= downsample
+        timings["detect_coarse"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        blobs = _refine_blobs(data, blobs, downsample, params)
+        timings["detect_refine"] = time.perf_counter() - t0
+
+    blobs[:, 0] += row_offset
+    blobs[:, 1] += col_offset
+    return blobs
+
+
+def get_blob_doh_defaults() -> dict:
+    """
+    Default `skimage.feature.blob_doh` arguments of `detect_blobs`, keyword
+    arguments passed to it override them
+    """
+    return dict(_blob_doh_defaults)
+
+
+def _refine_blobs(
+    data: np.array, blobs: np.array, downsample: int, params: dict
+) -> np.array:
+    """
+    Refine coarse blob positions and radii at full resolution, searching
+    sigmas within one downsampling factor of each coarse estimate in a window
+    around it. A detection is only taken as the same ion when it lies within
+    the coarse radius plus one block of the coarse center and no other coarse
+    blob is closer to it, so closely spaced ions are neither merged into duplicates nor
+    replaced by their neighbour. Blobs without such a match keep the coarse
+    estimate.
+    """
+    from skimage import feature
+
+    max_rows, max_cols = data.shape
+    refined = blobs.copy()
+    for i, (row, col, r) in enumerate(blobs):
+        w = int(np.ceil(2 * r)) + downsample
+        lrow, lcol = max(0, int(row) - w), max(0, int(col) - w)
+        hrow, hcol = min(max_rows, int(row) + w + 1), min(max_cols, int(col) + w + 1)
+
+        min_sigma = max(params["min_sigma"], r - downsample)
+        max_sigma = min(params["max_sigma"], r + downsample)
+        local = feature.blob_doh(
+            data[lrow:hrow, lcol:hcol],
+            **{
+                **params,
+                "min_sigma": min_sigma,
+                "max_sigma": max(max_sigma, min_sigma),
+                "num_sigma": 2 * downsample + 1,
+            },
+        )
+        if len(local) == 0:
+            continue
+
+        local[:, 0] += lrow
+        local[:, 1] += lcol
+        dist = np.hypot(local[:, 0] - row, local[:, 1] - col)
+        nearest = np.argmin(dist)
+        if dist[nearest] > r + downsample:
+            continue
+        owner = np.argmin(
+            np.hypot(blobs[:, 0] - local[nearest, 0], blobs[:, 1] - local[nearest, 1])
+        )
+        if owner == i:
+            refined[i] = local[nearest]
+
+    return refined
+
+
+def integrate_blobs(
+    data: np.array,
+    blobs: np.array,
+    integration_fns: list[IntegrationFns] = [IntegrationFns.BOX],
+    background_width: int | None = None,
+) -> pl.DataFrame:
+    """
+    Integrate the signal of every blob at once
+
+    Box sums and background annuli are read from a summed-area table of the
+    image when the blobs cover enough of it to pay for building the table,
+    otherwise every box is sliced and summed on its own. Norm sums are
+    gathered per radius with cached masks.
+
+    Args:
+        data: Ion image data matrix
+        blobs: (N, 3) array of blob row, column and radius
+        integration_fns: List of integration function names to evaluate the
+            ion signals with
+        background_width: Width of a square annulus around each ion's box to
+            estimate the local background from, disabled if None
+
+    Returns:
+        (pl.DataFrame): DataFrame containing the processed ion data
+    """
+    blobs = np.asarray(blobs, dtype=np.float64).reshape(-1, 3)
+    rows = blobs[:, 0].astype(np.int64)
+    cols = blobs[:, 1].astype(np.int64)
+    radii = blobs[:, 2]
+
+    res = {"row": rows, "col": cols, "radius": radii}
+
+    table = None
+    box = IntegrationFns.BOX in integration_fns
+    if _table_pays_off(data.shape, radii, box, background_width):
+        table = _integral_image(data)
+
+    for integration_fn in integration_fns:
+        if integration_fn == IntegrationFns.BOX:
+            res[f"{integration_fn}_sum"] = _batch_integrate_box(
+                data, table, rows, cols, radii
+            )
+        else:
+            fn = _batch_integration_fns[integration_fn]
+            res[f"{integration_fn}_sum"] = fn(data, rows, cols, radii)
+
+    if background_width is not None:
+        bkg_sum, bkg_area = _batch_integrate_annulus(
+            data, table, rows, cols, radii, background_width
+        )
+        res["bkg_sum"] = bkg_sum
+        res["bkg_mean"] = bkg_sum / np.maximum(bkg_area, 1)
+
+    return pl.DataFrame(res)
+
+
+def get_stack_signals(
+    stack: np.array,
+    integration_fns: list[IntegrationFns] = [IntegrationFns.BOX],
+    background_width: int | None = None,
+    reference: np.ndarray | None = None,
+    blobs: np.ndarray | None = None,
+    downsample: int = 1,
+    roi: tuple[int, int, int, int] | None = None,
+    timings: dict[str, float] | None = None,
+    **kwargs,
+) -> pl.DataFrame:
+    """
+    Detect ions once on a reference image and integrate them in every frame
+    of an image stack
+
+    Args:
+        stack: (N, H, W) stack of ion image data matrices
+        integration_fns: List of integration function names to evaluate the
+            ion signals with
+        background_width: Width of a square annulus around each ion's box to
+            estimate the local background from, disabled if None
+        reference: Image to detect the ions on, defaults to the sum of the stack
+        blobs: Precomputed (N, 3) array of blob row, column and radius, skips
+            the blob detection if provided
+        downsample: Factor to downsample the reference by for a coarse
+            detection pass, see `detect_blobs`
+        roi: (row_min, row_max, col_min, col_max) region to detect blobs in
+        timings: Dictionary to record the duration in seconds of every stage in
+        kwargs: Key work arguments for `skimage.feature.blob_doh`, the ion
+            position and size identifier
+
+    Returns:
+        (pl.DataFrame): long format DataFrame with a row per frame and ion
+    """
+    timings = {} if timings is None else timings
+
+    if blobs is None:
+        t0 = time.perf_counter()
+        if reference is None:
+            reference = stack.sum(axis=0)
+        timings["reference"] = time.perf_counter() - t0
+
+        blobs = detect_blobs(
+            reference, downsample=downsample, roi=roi, timings=timings, **kwargs
+        )
+
+    t0 = time.perf_counter()
+    res = integrate_stack(
+        stack,
+        blobs,
+        integration_fns=integration_fns,
+        background_width=background_width,
     )
+    timings["integrate"] = time.perf_counter() - t0
 
-    res = defaultdict(list)
-    for row, col, r in blobs:
-        row, col = int(row), int(col)
-        res["row"].append(row)
-        res["col"].append(col)
-        res["radius"].append(r)
+    return res
+
+
+def integrate_stack(
+    stack: np.array,
+    blobs: np.array,
+    integration_fns: list[IntegrationFns] = [IntegrationFns.BOX],
+    background_width: int | None = None,
+    chunk_size: int = 10_000_000,
+) -> pl.DataFrame:
+    """
+    Integrate fixed ion regions in every frame of an image stack
+
+    The pixels of every region are resolved once, then each integration is a
+    single gather and segmented sum over all frames. The regions are identical
+    to the ones used by `integrate_blobs`.
 
-        for integration_fn in integration_fns:
-            fn = _integration_fns[integration_fn]
-            res[f"{integration_fn}_sum"].append(fn(data, row, col, r))
+    Args:
+        stack: (N, H, W) stack of ion image data matrices, may be memory mapped
+        blobs: (M, 3) array of blob row, column and radius
+        integration_fns: List of integration function names to evaluate the
+            ion signals with
+        background_width: Width of a square annulus around each ion's box to
+            estimate the local background from, disabled if None
+        chunk_size: Maximum number of gathered values held in memory at once
+
+    Returns:
+        (pl.DataFrame): long format DataFrame with a row per frame and ion
+    """
+    blobs = np.asarray(blobs, dtype=np.float64).reshape(-1, 3)
+    rows = blobs[:, 0].astype(np.int64)
+    cols = blobs[:, 1].astype(np.int64)
+    radii = blobs[:, 2]
+
+    num_frames = stack.shape[0]
+    num_ions = len(blobs)
+    frames = stack.reshape(num_frames, -1)
+    shape = stack.shape[1:]
+
+    res = {
+        "frame": np.repeat(np.arange(num_frames), num_ions),
+        "ion": np.tile(np.arange(num_ions), num_frames),
+        "row": np.tile(rows, num_frames),
+        "col": np.tile(cols, num_frames),
+        "radius": np.tile(radii, num_frames),
+    }
+
+    for integration_fn in integration_fns:
+        pixels, ids = _region_pixels(shape, rows, cols, radii, integration_fn)
+        sums = _segment_sums(frames, pixels, ids, num_ions, chunk_size)
+        res[f"{integration_fn}_sum"] = sums.ravel()
+
+    if background_width is not None:
+        pixels, ids = _annulus_pixels(shape, rows, cols, radii, background_width)
+        bkg_sum = _segment_sums(frames, pixels, ids, num_ions, chunk_size)
+        bkg_area = np.bincount(ids, minlength=num_ions)
+        res["bkg_sum"] = bkg_sum.ravel()
+        res["bkg_mean"] = (bkg_sum / np.maximum(bkg_area, 1)).ravel()
 
     return pl.DataFrame(res)
 
 
+def _region_pixels(
+    shape: tuple[int, int],
+    rows: np.array,
+    cols: np.array,
+    radii: np.array,
+    integration_fn: IntegrationFns,
+) -> tuple[np.array, np.array]:
+    """
+    Flat pixel indices of every blob's integration region and the blob index
+    each pixel belongs to, ordered by blob
+    """
+    max_rows, max_cols = shape
+    r = np.ceil(radii).astype(np.int64)
+
+    pixels, ids = [], []
+    for i, (row, col, radius) in enumerate(zip(rows, cols, r)):
+        if integration_fn == IntegrationFns.BOX:
+            prow, pcol = np.meshgrid(
+                np.arange(max(0, row - radius), min(max_rows, row + radius)),
+                np.arange(max(0, col - radius), min(max_cols, col + radius)),
+                indexing="ij",
+            )
+        else:
+            ord = _norm_orders[integration_fn]
+            dy, dx = np.nonzero(_norm_mask(int(radius), ord))
+            prow, pcol = row + dy - radius, col + dx - radius
+            inside = (prow >= 0) & (prow < max_rows) & (pcol >= 0) & (pcol < max_cols)
+            prow, pcol = prow[inside], pcol[inside]
+
+        pixels.append((prow * max_cols + pcol).ravel())
+        ids.append(np.full(pixels[-1].size, i))
+
+    return _concat_indices(pixels), _concat_indices(ids)
+
+
+def _annulus_pixels(
+    shape: tuple[int, int],
+    rows: np.array,
+    cols: np.array,
+    radii: np.array,
+    width: int,
+) -> tuple[np.array, np.array]:
+    """
+    Flat pixel indices of the square annulus of `width` pixels around every
+    blob's box and the blob index each pixel belongs to, ordered by blob
+    """
+    r = np.ceil(radii).astype(np.int64)
+    inner, inner_ids = _region_pixels(shape, rows, cols, r, IntegrationFns.BOX)
+    outer, outer_ids = _region_pixels(shape, rows, cols, r + width, IntegrationFns.BOX)
+
+    # pixels are unique within a blob, so tag them with their blob to remove
+    # the inner box of each blob from its own outer box only
+    size = shape[0] * shape[1]
+    keep = ~np.isin(outer_ids * size + outer, inner_ids * size + inner)
+    return outer[keep], outer_ids[keep]
+
+
+def _segment_sums(
+    frames: np.array, pixels: np.array, ids: np.array, num_ions: int, chunk_size: int
+) -> np.array:
+    """
+    Sum the pixels of every ion in every frame
+
+    Args:
+        frames: (N, H * W) flattened image stack
+        pixels: flat pixel indices ordered by ion
+        ids: ion index of every pixel
+        num_ions: number of ions
+        chunk_size: maximum number of gathered values held in memory at once
+
+    Returns:
+        (np.array): (N, num_ions) sums
+    """
+    num_frames = frames.shape[0]
+    res = np.zeros(
+        (num_frames, num_ions), dtype=np.result_type(frames.dtype, np.int64)
+    )
+    if pixels.size == 0:
+        return res
+
+    # ions without pixels get no segment, every other segment is contiguous
+    counts = np.bincount(ids, minlength=num_ions)
+    nonempty = counts > 0
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[nonempty]
+
+    step = max(1, chunk_size // pixels.size)
+    for i in range(0, num_frames, step):
+        values = frames[i : i + step][:, pixels]
+        res[i : i + step, nonempty] = np.add.reduceat(values, starts, axis=1)
+
+    return res
+
+
+def _concat_indices(indices: list[np.array]) -> np.array:
+    if not indices:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(indices).astype(np.int64)
+
+
+def _integral_image(data: np.array) -> np.array:
+    """
+    Summed-area table of the image, zero padded so that `table[i, j]` is the
+    sum of `data[:i, :j]`. Integer images are summed exactly in int64.
+
+    Args:
+        data: Ion image data matrix
+
+    Returns:
+        (np.array): table of shape (rows + 1, cols + 1)
+    """
+    dtype = np.result_type(data.dtype, np.int64)
+    table = np.zeros((data.shape[0] + 1, data.shape[1] + 1), dtype=dtype)
+    np.cumsum(data, axis=0, dtype=dtype, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+    return table
+
+
+def _box_bounds(
+    shape: tuple[int, int], rows: np.array, cols: np.array, r: np.array
+) -> tuple[np.array, np.array, np.array, np.array]:
+    max_rows, max_cols = shape
+    lrow = np.clip(rows - r, 0, max_rows)
+    hrow = np.clip(rows + r, 0, max_rows)
+    lcol = np.clip(cols - r, 0, max_cols)
+    hcol = np.clip(cols + r, 0, max_cols)
+    return lrow, hrow, lcol, hcol
+
+
+def _table_pays_off(
+    shape: tuple[int, int],
+    radii: np.array,
+    box: bool,
+    background_width: int | None,
+) -> bool:
+    """
+    Whether building a summed-area table is cheaper than slicing every box
+
+    The table costs about two cumulative sums over the whole image, a slice
+    costs a fixed python overhead plus a sum over its pixels. Both costs are
+    expressed in pixels of table building, measured with numpy on float64
+    and int64 images.
+    """
+    r = np.ceil(radii)
+    num_slices = 0
+    pixels = 0.0
+    if box:
+        num_slices += len(r)
+        pixels += np.sum((2 * r) ** 2)
+    if background_width is not None:
+        num_slices += 2 * len(r)
+        pixels += np.sum((2 * r) ** 2 + (2 * (r + background_width)) ** 2)
+
+    cost = num_slices * _SLICE_COST + pixels * _SLICE_PIXEL_COST
+    return cost > shape[0] * shape[1]
+
+
+def _box_sums(data, table, lrow, hrow, lcol, hcol) -> np.array:
+    """
+    Sums of the boxes `data[lrow:hrow, lcol:hcol]`, read from the summed-area
+    `table` if given, otherwise sliced one at a time
+    """
+    if table is not None:
+        return (
+            table[hrow, hcol]
+            - table[lrow, hcol]
+            - table[hrow, lcol]
+            + table[lrow, lcol]
+        )
+
+    res = np.zeros(len(lrow), dtype=np.result_type(data.dtype, np.int64))
+    for i, bounds in enumerate(zip(lrow, hrow, lcol, hcol)):
+        lr, hr, lc, hc = bounds
+        res[i] = data[lr:hr, lc:hc].sum()
+    return res
+
+
+def _batch_integrate_box(
+    data: np.array,
+    table: np.ndarray | None,
+    rows: np.array,
+    cols: np.array,
+    radii: np.array,
+) -> np.array:
+    """
+    Vectorized `_integrate_box` over every blob
+
+    Args:
+        data: Ion image data matrix
+        table: Summed-area table from `_integral_image`, or None to slice the
+            boxes from `data`
+        rows: row indices of the blob centers
+        cols: column indices of the blob centers
+        radii: blob radii
+
+    Returns:
+        (np.array): integrated value of every blob
+    """
+    r = np.ceil(radii).astype(np.int64)
+    return _box_sums(data, table, *_box_bounds(data.shape, rows, cols, r))
+
+
+def _batch_integrate_annulus(
+    data: np.array,
+    table: np.ndarray | None,
+    rows: np.array,
+    cols: np.array,
+    radii: np.array,
+    width: int,
+) -> tuple[np.array, np.array]:
+    """
+    Sum of the square annulus of `width` pixels surrounding every blob's box
+
+    Args:
+        data: Ion image data matrix
+        table: Summed-area table from `_integral_image`, or None to slice the
+            boxes from `data`
+        rows: row indices of the blob centers
+        cols: column indices of the blob centers
+        radii: blob radii
+        width: width of the annulus in pixels
+
+    Returns:
+        (tuple[np.array, np.array]): annulus sums and annulus areas in pixels
+    """
+    r = np.ceil(radii).astype(np.int64)
+    inner = _box_bounds(data.shape, rows, cols, r)
+    outer = _box_bounds(data.shape, rows, cols, r + width)
+
+    def area(lrow, hrow, lcol, hcol):
+        return (hrow - lrow) * (hcol - lcol)
+
+    bkg_sum = _box_sums(data, table, *outer) - _box_sums(data, table, *inner)
+    bkg_area = area(*outer) - area(*inner)
+    return bkg_sum, bkg_area
+
+
+def _batch_integrate_norm(
+    data: np.array,
+    rows: np.array,
+    cols: np.array,
+    radii: np.array,
+    ord: float = 2,
+    chunk_size: int = 262_144,
+) -> np.array:
+    """
+    Vectorized `_integrate_norm` over every blob. Blobs are grouped by integer
+    radius and each group gathers its masked pixels from the flattened image
+    in a few indexing operations.
+
+    Args:
+        data: Ion image data matrix
+        rows: row indices of the blob centers
+        cols: column indices of the blob centers
+        radii: blob radii
+        ord: order of the norm defining the region edge
+        chunk_size: Maximum number of gathered pixels held in memory at once
+
+    Returns:
+        (np.array): integrated value of every blob
+    """
+    r = np.ceil(radii).astype(np.int64)
+    res = np.zeros(len(r), dtype=np.result_type(data.dtype, np.int64))
+    if len(r) == 0:
+        return res
+
+    # regions crossing the image edge are clipped per blob, the rest are
+    # gathered as flat offsets from their centers in chunks of `chunk_size`
+    max_rows, max_cols = data.shape
+    inside = (rows - r >= 0) & (rows + r < max_rows)
+    inside &= (cols - r >= 0) & (cols + r < max_cols)
+    for i in np.flatnonzero(~inside):
+        res[i] = _integrate_norm(data, rows[i], cols[i], r[i], ord)
+
+    flat = np.ravel(data)
+    for radius in np.unique(r[inside]):
+        idx = np.flatnonzero(inside & (r == radius))
+        dy, dx = np.nonzero(_norm_mask(int(radius), ord))
+        offsets = (dy - radius) * max_cols + (dx - radius)
+        centers = rows[idx] * max_cols + cols[idx]
+        step = max(1, chunk_size // offsets.size)
+        for i in range(0, len(idx), step):
+            pixels = centers[i : i + step, None] + offsets
+            res[idx[i : i + step]] = flat[pixels].sum(axis=1)
+
+    return res
+
+
 def _integrate_box(data: np.array, row: int, col: int, r: float) -> float:
     """
     Integrate a boxed region around a provided center point. The area will be
@@ -76,7 +667,9 @@ def _integrate_box(data: np.array, row: int, col: int, r: float) -> float:
     return data[lrow:hrow, lcol:hcol].sum()
 
 
-def _integrate_norm(data: np.array, row: int, col: int, r: float, **kwargs) -> float:
+def _integrate_norm(
+    data: np.array, row: int, col: int, r: float, ord: float = 2
+) -> float:
     """
     Integrate a circular region with radius r around a provided center point
     whos outer edge is defined by a norm order
@@ -86,49 +679,71 @@ def _integrate_norm(data: np.array, row: int, col: int, r: float, **kwargs) -> f
         row: row index of the center point to integrate around
         col: column index of the center point to integrate around
         r: radius of region around the center point to integrate around
-        kwargs: additional arguments to pass to `numpy.linalg.norm`
-            e.g. `ord` defining the order of the norm
+        ord: order of the norm defining the region edge, as accepted by
+            `numpy.linalg.norm` e.g. 1 for a diamond and 2 for a disk
 
     Returns:
         (float): integrated value of region surrounding input center point
     """
-    irow, icol = row, col
-    max_rows = len(data)
-    max_cols = len(data[0])
-    r = np.ceil(r)
-
-    res = 0
-    seen = set()
-    queue = deque([(row, col)])
-    while queue:
-        row, col = queue.popleft()
-        seen.add((row, col))
-        res += data[row, col]
-
-        for dy, dx in ((1, 0), (0, 1), (-1, 0), (0, -1)):
-            nrow, ncol = row + dy, col + dx
-            if (nrow, ncol) in seen:
-                continue
-            if nrow < 0 or ncol < 0:
-                continue
-            if nrow >= max_rows or ncol >= max_cols:
-                continue
-            if (
-                np.linalg.norm(
-                    np.array((nrow, ncol)) - np.array((irow, icol)),
-                    **kwargs,
-                )
-                > r
-            ):
-                continue
-
-            queue.append((nrow, ncol))
+    max_rows, max_cols = data.shape
+    r = int(np.ceil(r))
+    mask = _norm_mask(r, ord)
 
-    return res
+    lrow = max(0, row - r)
+    hrow = min(max_rows, row + r + 1)
+    lcol = max(0, col - r)
+    hcol = min(max_cols, col + r + 1)
+
+    # clip the mask the same way the image slice is clipped at the edges
+    mask = mask[lrow - row + r : hrow - row + r, lcol - col + r : hcol - col + r]
+    return data[lrow:hrow, lcol:hcol][mask].sum()
 
 
+@lru_cache(maxsize=None)
+def _norm_mask(r: int, ord: float) -> np.array:
+    """
+    Boolean stencil of the pixels within distance r of the center of a
+    (2r+1, 2r+1) window, measured with a norm of order `ord`
+
+    Args:
+        r: integer radius of the stencil
+        ord: order of the norm, as accepted by `numpy.linalg.norm`
+
+    Returns:
+        (np.array): read only boolean mask of shape (2r+1, 2r+1)
+    """
+    offsets = np.arange(-r, r + 1)
+    dy, dx = np.meshgrid(offsets, offsets, indexing="ij")
+    dist = np.linalg.norm(np.stack((dy, dx), axis=-1), ord=ord, axis=-1)
+    mask = dist <= r
+    mask.flags.writeable = False
+    return mask
+
+
+_blob_doh_defaults = {
+    "min_sigma": 1,
+    "max_sigma": 30,
+    "num_sigma": 12,
+    "threshold_rel": 0.5,
+}
+
+# cost of slicing and summing one box, and of every pixel it sums, relative
+# to the cost per pixel of building a summed-area table
+_SLICE_COST = 600
+_SLICE_PIXEL_COST = 0.25
+
+_norm_orders = {
+    IntegrationFns.L1.value: 1,
+    IntegrationFns.L2.value: 2,
+}
+
 _integration_fns = {
     IntegrationFns.BOX.value: _integrate_box,
     IntegrationFns.L1.value: partial(_integrate_norm, ord=1),
     IntegrationFns.L2.value: partial(_integrate_norm, ord=2),
 }
+
+_batch_integration_fns = {
+    IntegrationFns.L1.value: partial(_batch_integrate_norm, ord=1),
+    IntegrationFns.L2.value: partial(_batch_integrate_norm, ord=2),
+}
@@ -0,0 +1,89 @@
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+
+def load_image(path: str | Path, delimiter: str = ",", cache: bool = False) -> np.array:
+    """
+    Load an ion image data matrix
+
+    `.npy` files are memory mapped. For text files a binary `.npy` cache with
+    the same stem is used instead when it is at least as new as the text file.
+
+    Args:
+        path: path to a `.npy` file or a delimited text file
+        delimiter: column delimiter of text files
+        cache: write a `.npy` cache next to text files after parsing them
+
+    Returns:
+        (np.array): image data matrix
+    """
+    path = Path(path)
+    if path.suffix == ".npy":
+        return np.load(path, mmap_mode="r")
+
+    cached = path.with_suffix(".npy")
+    if cached.exists() and cached.stat().st_mtime >= path.stat().st_mtime:
+        return np.load(cached, mmap_mode="r")
+
+    data = read_text_matrix(path, delimiter=delimiter)
+    if cache:
+        np.save(cached, data)
+
+    return data
+
+
+def read_text_matrix(path: str | Path, delimiter: str = ",") -> np.array:
+    """
+    Parse a delimited text matrix with polars' multithreaded csv reader,
+    equivalent to `np.loadtxt(path, delimiter=delimiter)`. With a single
+    thread available numpy's own parser is faster for wide matrices, so it is
+    used instead.
+
+    Args:
+        path: path to the text file
+        delimiter: column delimiter
+
+    Returns:
+        (np.array): float64 data matrix
+    """
+    if pl.thread_pool_size() <= 1:
+        return np.loadtxt(path, delimiter=delimiter)
+
+    # every column is read as text and cast, types inferred from the first
+    # rows would reject a float further down an integer looking column
+    df = pl.read_csv(path, has_header=False, separator=delimiter, infer_schema=False)
+    return df.select(pl.all().str.strip_chars().cast(pl.Float64)).to_numpy()
+
+
+def load_stack(
+    paths: list[str | Path], delimiter: str = ",", cache: bool = False
+) -> tuple[np.array, list[str]]:
+    """
+    Load image files into a single (N, H, W) stack. Files holding a stack
+    themselves (3 dimensional `.npy`) contribute all of their frames.
+
+    Args:
+        paths: paths to the image files
+        delimiter: column delimiter of text files
+        cache: write a `.npy` cache next to text files after parsing them
+
+    Returns:
+        (tuple[np.array, list[str]]): the stack and the source file of every
+            frame
+    """
+    if len(paths) == 1:
+        data = load_image(paths[0], delimiter=delimiter, cache=cache)
+        if data.ndim == 3:
+            # keep a single stack file memory mapped instead of copying it
+            return data, [str(paths[0])] * len(data)
+
+    frames, sources = [], []
+    for path in paths:
+        data = load_image(path, delimiter=delimiter, cache=cache)
+        data = data.reshape(-1, *data.shape[-2:])
+        frames.append(data)
+        sources.extend([str(path)] * len(data))
+
+    return np.concatenate(frames), sources
@@ -0,0 +1,242 @@
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+import tyro
+
+import tg_lab.ion_integration.compute as ipc
+from tg_lab.ion_integration.cli import read_blobs
+from tg_lab.shared_image import DESCRIPTOR_NAME, SharedImage
+
+
+@dataclass
+class MonitorConfig:
+    """
+    Integrates the ion signals of a running acquisition at a fixed cadence and
+    appends them to a time series
+    """
+
+    source: str
+    """acquisition output directory of a single device, or its shared_image.json"""
+
+    output_file: str
+    """csv file to append the per-ion time series to"""
+
+    integration_fns: list[ipc.IntegrationFns]
+    """list of integration functions to sum ion image data"""
+
+    interval: float = 5.0
+    """seconds between evaluations"""
+
+    background_width: int | None = None
+    """width of the annulus around each ion to estimate local background from"""
+
+    blobs_file: str | None = None
+    """csv with row, col and radius columns to integrate as fixed regions instead
+    of detecting the ions in every evaluation. Detected ions keep their index
+    across evaluations by matching them to the ions found before"""
+
+    downsample: int = 1
+    """factor to downsample the image by for a coarse ion detection pass"""
+
+    roi: tuple[int, int, int, int] | None = None
+    """(row_min, row_max, col_min, col_max) region to detect ions in"""
+
+    max_sigma: float = 30
+    """largest ion size searched for by the detection"""
+
+    num_sigma: int = 12
+    """number of ion sizes searched for by the detection"""
+
+    min_images: int = 1
+    """number of accumulated images before the first evaluation"""
+
+    retries: int = 3
+    """evaluations repeated when a frame was added while integrating, the last
+    one is kept and flagged as not stable"""
+
+    wait: float = 60
+    """seconds to wait for the acquisition to publish its image"""
+
+
+def attach(source: str | Path, wait: float = 60, poll: float = 0.5) -> SharedImage:
+    """
+    Attach to the shared image of an acquisition, waiting for it to start
+    """
+    path = Path(source)
+    if path.is_dir() or path.suffix != ".json":
+        path = path / DESCRIPTOR_NAME
+
+    deadline = time.monotonic() + wait
+    while not path.exists():
+        if time.monotonic() > deadline:
+            raise FileNotFoundError(f"no shared image published at {path}")
+        time.sleep(poll)
+
+    return SharedImage.attach(path)
+
+
+class IonTracker:
+    """
+    Stable ion indices for blobs detected anew in every evaluation
+
+    Every detection is matched to the nearest known ion within that ion's
+    radius, each known ion taking at most one detection, closest pairs first.
+    Matched detections keep the index of their ion and update its position,
+    the others become new ions. Ions missing from one evaluation keep their
+    index for when they are detected again.
+    """
+
+    def __init__(self):
+        self.blobs = np.zeros((0, 3))
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.next_id = 0
+
+    def assign(self, blobs: np.ndarray) -> np.ndarray:
+        """
+        Index of every blob, matched against the ions seen before
+
+        Args:
+            blobs: (N, 3) array of blob row, column and radius
+
+        Returns:
+            (np.array): (N,) ion indices
+        """
+        blobs = np.asarray(blobs, dtype=np.float64).reshape(-1, 3)
+        ids = np.full(len(blobs), -1, dtype=np.int64)
+
+        if len(blobs) and len(self.blobs):
+            from scipy.spatial import cKDTree
+
+            dist, known = cKDTree(self.blobs[:, :2]).query(
+                blobs[:, :2], distance_upper_bound=self.blobs[:, 2].max()
+            )
+            taken = set()
+            for i in np.argsort(dist):
+                if not np.isfinite(dist[i]):
+                    break
+                k = known[i]
+                if k in taken or dist[i] > self.blobs[k, 2]:
+                    continue
+                taken.add(k)
+                ids[i] = self.ids[k]
+                self.blobs[k] = blobs[i]
+
+        new = ids < 0
+        ids[new] = np.arange(self.next_id, self.next_id + new.sum())
+        self.next_id += int(new.sum())
+        self.blobs = np.concatenate([self.blobs, blobs[new]])
+        self.ids = np.concatenate([self.ids, ids[new]])
+        return ids
+
+
+def evaluate(
+    shared: SharedImage,
+    config: MonitorConfig,
+    blobs: np.ndarray | None = None,
+    tracker: IonTracker | None = None,
+) -> pl.DataFrame:
+    """
+    Integrate the ion signals of the shared image in place
+
+    The integration reads the live image without copying it. The acquisition
+    never waits on the monitor, instead the integration is repeated when a
+    frame was added while it ran. Ions are detected once per evaluation.
+
+    Args:
+        shared: shared image of the acquisition
+        config: monitor config
+        blobs: fixed (N, 3) regions to integrate, indexed by their order.
+            Ions are detected in the image if None
+        tracker: keeps the indices of detected ions stable across
+            evaluations, detected ions are indexed by their order if None
+
+    Returns:
+        (pl.DataFrame): one row per ion with the image and event count the
+            signals belong to
+    """
+    # positions tolerate a half updated image, so the slow detection runs
+    # once and only the integration is repeated under the sequence check
+    regions = blobs
+    if regions is None:
+        regions = ipc.detect_blobs(
+            shared.array,
+            downsample=config.downsample,
+            roi=config.roi,
+            max_sigma=config.max_sigma,
+            num_sigma=config.num_sigma,
+        )
+
+    for _ in range(max(config.retries, 0) + 1):
+        sequence = shared.sequence
+        image_count, event_count = shared.image_count, shared.event_count
+        res = ipc.integrate_blobs(
+            shared.array,
+            regions,
+            integration_fns=config.integration_fns,
+            background_width=config.background_width,
+        )
+        stable = shared.is_stable(sequence)
+        if stable:
+            break
+
+    if blobs is None and tracker is not None:
+        ids = tracker.assign(regions)
+    else:
+        ids = np.arange(res.height)
+
+    return res.select(
+        pl.lit(image_count).alias("image_count"),
+        pl.lit(event_count).alias("event_count"),
+        pl.lit(stable).alias("stable"),
+        pl.Series("ion", ids),
+        pl.all(),
+    ).sort("ion")
+
+
+def entry_point(config: MonitorConfig) -> None:
+    blobs = None
+    if config.blobs_file is not None:
+        blobs = read_blobs(config.blobs_file)
+    tracker = IonTracker()
+
+    shared = attach(config.source, wait=config.wait)
+    print(f"    >Monitoring {shared.shape} image every {config.interval} s")
+
+    output_file = Path(config.output_file)
+    start = time.monotonic()
+    last_count = 0
+    try:
+        while True:
+            tick = time.monotonic()
+            # read the flag first so the image of the final frame is evaluated
+            done = shared.done
+            count = shared.image_count
+            if count >= config.min_images and count != last_count:
+                res = evaluate(shared, config, blobs=blobs, tracker=tracker)
+                res = res.select(
+                    pl.lit(tick - start).alias("elapsed (s)"), pl.all()
+                )
+                with open(output_file, "a") as f:
+                    res.write_csv(f, include_header=f.tell() == 0)
+                last_count = count
+                print(f"    >images: {count}, ions: {res.height}")
+
+            if done:
+                break
+            time.sleep(max(config.interval - (time.monotonic() - tick), 0))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shared.close()
+
+
+def main():
+    config = tyro.cli(MonitorConfig)
+    entry_point(config)
+
+
+if __name__ == "__main__":
+    main()
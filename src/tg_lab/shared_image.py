@@ -0,0 +1,140 @@
+import json
+import os
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+
+import numpy as np
+
+DESCRIPTOR_NAME = "shared_image.json"
+
+# int64 header slots in front of the image
+SEQUENCE, IMAGE_COUNT, EVENT_COUNT, DONE = range(4)
+HEADER_BYTES = 64
+
+
+class SharedImage:
+    """
+    Image in a named shared memory block, written by one process and read in
+    place by others
+
+    The block starts with a small int64 header holding a sequence number, the
+    image and event counts and a done flag. The writer makes the sequence odd
+    while it updates the image, so readers can tell whether the image changed
+    underneath them (a seqlock) without ever blocking the writer.
+
+    A json descriptor with the block name, shape and dtype is written next to
+    the acquisition output for readers to attach with.
+    """
+
+    def __init__(
+        self,
+        shm: shared_memory.SharedMemory,
+        shape: tuple[int, ...],
+        dtype: np.dtype,
+        owner: bool,
+    ):
+        self.shm = shm
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = owner
+        self.header = np.ndarray((4,), dtype=np.int64, buffer=shm.buf)
+        self.array = np.ndarray(
+            self.shape, dtype=self.dtype, buffer=shm.buf, offset=HEADER_BYTES
+        )
+        self.descriptor_path = None
+
+    @classmethod
+    def create(
+        cls,
+        shape: tuple[int, ...],
+        dtype=np.float64,
+        descriptor_path: str | Path | None = None,
+    ):
+        """
+        Allocate a zeroed shared image and write its descriptor
+        """
+        dtype = np.dtype(dtype)
+        size = HEADER_BYTES + int(np.prod(shape)) * dtype.itemsize
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        image = cls(shm, shape, dtype, owner=True)
+        image.header[:] = 0
+        image.array[:] = 0
+
+        if descriptor_path is not None:
+            image.descriptor_path = Path(descriptor_path)
+            descriptor = {
+                "name": shm.name,
+                "shape": list(image.shape),
+                "dtype": dtype.str,
+                "header_bytes": HEADER_BYTES,
+                "pid": os.getpid(),
+            }
+            # renamed into place so readers never parse a partial descriptor
+            tmp = image.descriptor_path.with_suffix(".tmp")
+            with open(tmp, "w") as f:
+                json.dump(descriptor, f, indent=4)
+            os.replace(tmp, image.descriptor_path)
+
+        return image
+
+    @classmethod
+    def attach(cls, descriptor_path: str | Path):
+        """
+        Attach to the shared image described by a descriptor file
+        """
+        with open(descriptor_path) as f:
+            descriptor = json.load(f)
+
+        shm = shared_memory.SharedMemory(name=descriptor["name"])
+        if os.name == "posix":
+            # attaching registers the block with this process' resource tracker,
+            # which would unlink it when the reader exits
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, descriptor["shape"], descriptor["dtype"], owner=False)
+
+    @property
+    def sequence(self) -> int:
+        return int(self.header[SEQUENCE])
+
+    @property
+    def image_count(self) -> int:
+        return int(self.header[IMAGE_COUNT])
+
+    @property
+    def event_count(self) -> int:
+        return int(self.header[EVENT_COUNT])
+
+    @property
+    def done(self) -> bool:
+        return bool(self.header[DONE])
+
+    def begin_write(self):
+        self.header[SEQUENCE] += 1
+
+    def end_write(self, image_count: int, event_count: int):
+        self.header[IMAGE_COUNT] = image_count
+        self.header[EVENT_COUNT] = event_count
+        self.header[SEQUENCE] += 1
+
+    def is_stable(self, sequence: int) -> bool:
+        """
+        Whether no write started or was in progress since `sequence` was read
+        """
+        return sequence % 2 == 0 and self.sequence == sequence
+
+    def mark_done(self):
+        self.header[DONE] = 1
+
+    def close(self):
+        """
+        Release the mapping, the writer also removes the block and descriptor.
+        Readers still attached keep their mapping until they close it.
+        """
+        # views have to be dropped before the buffer can be released
+        self.header = None
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+            if self.descriptor_path is not None:
+                self.descriptor_path.unlink(missing_ok=True)
@@ -1,12 +1,11 @@
 import datetime
 import json
 import os
-from dataclasses import asdict, dataclass
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
 
 import tyro
 
-from tg_lab.tis_camera.image_acquisition import process_on_trigger
 from tg_lab.utils import get_event_id
 
 
@@ -20,7 +19,12 @@ class EventCountConfig:
     multiply_factor: int = 10
     int_offset: int = 10
     event_size: int = 1
+    upsample: int = 1
     keyboard_control: bool = False
+    telemetry_interval: float = 1.0
+    telemetry_port: int | None = None
+    serials: list[str] = field(default_factory=list)
+    shared_memory: bool = False
 
     def __post_init__(self):
         date = datetime.datetime.now().strftime("%Y%m%d")
@@ -28,6 +32,9 @@ class EventCountConfig:
 
 
 def entry_point(config: EventCountConfig):
+    # the camera SDK is only loaded once an acquisition actually starts
+    from tg_lab.tis_camera.image_acquisition import process_on_trigger
+
     path = Path(config.output_dir) / get_event_id(name="event_count")
     os.makedirs(path)
     print(f"    >Output location: {path}")
@@ -44,7 +51,12 @@ def entry_point(config: EventCountConfig):
         multiply_factor=config.multiply_factor,
         int_offset=config.int_offset,
         event_size=config.event_size,
+        upsample=config.upsample,
         keyboard_control=config.keyboard_control,
+        telemetry_interval=config.telemetry_interval,
+        telemetry_port=config.telemetry_port,
+        serials=config.serials,
+        shared_memory=config.shared_memory,
     )
 
 
@@ -1,12 +1,255 @@
 import datetime
 import json
 import threading
+import time
 from pathlib import Path
 
 import imagingcontrol4 as ic4
 import numpy as np
 
-from tg_lab.ion_event_counting.fastvimprocess import event_counting
+from tg_lab.ion_event_counting.fastvimprocess import event_centroiding, event_counting
+from tg_lab.shared_image import DESCRIPTOR_NAME, SharedImage
+from tg_lab.tis_camera.telemetry import Telemetry
+
+
+class StopCondition:
+    """
+    Stop event shared by every device of an acquisition. The event is set once
+    all devices have reached their image count, or directly by the keyboard
+    """
+
+    def __init__(self, num_devices: int):
+        self.event = threading.Event()
+        self._remaining = num_devices
+        self._lock = threading.Lock()
+
+    def device_done(self):
+        with self._lock:
+            self._remaining -= 1
+            if self._remaining <= 0:
+                self.event.set()
+
+
+# Define a listener class to receive queue sink notifications
+class Listener(ic4.QueueSinkListener):
+    """
+    Event counting pipeline of a single device
+
+    Every grabber delivers its frames on its own callback thread and
+    `event_counting` releases the GIL, so several devices are processed on
+    separate cores concurrently
+
+    With `shared` the accumulator lives in that shared memory block, so a
+    monitor process can read the rolling image while frames keep arriving.
+    With `upsample` > 1 events are accumulated at their sub-pixel centroids
+    on a grid `upsample` times finer than the sensor
+    """
+
+    def __init__(
+        self,
+        shape: tuple[int, int],
+        max_images: int,
+        stop: StopCondition,
+        telemetry: Telemetry,
+        threshold,
+        mode,
+        nxnarea,
+        multiply_factor,
+        int_offset,
+        event_size=1,
+        upsample=1,
+        shared: SharedImage | None = None,
+    ):
+        self.max_images = max_images
+        self.stop = stop
+        self.telemetry = telemetry
+        self.params = (threshold, mode, nxnarea, multiply_factor, int_offset, event_size)
+        self.upsample = upsample
+        self._start_time = datetime.datetime.now()
+        self.image_counter = 0
+        self.event_counter = 0
+        self.shared = shared
+        shape = (shape[0] * upsample, shape[1] * upsample)
+        self.sum_arr = np.zeros(shape) if shared is None else shared.array
+
+    def sink_connected(
+        self,
+        sink: ic4.QueueSink,
+        image_type: ic4.ImageType,
+        min_buffers_required: int,
+    ) -> bool:
+        # No need to configure anything, just accept the connection
+        return True
+
+    def frames_queued(self, sink: ic4.QueueSink):
+        t0 = time.perf_counter()
+
+        # Get the queued image buffer
+        buffer = sink.pop_output_buffer()
+
+        # this device is finished but others may still be acquiring, drop the
+        # extra frames so every device contributes exactly max_images
+        if self.image_counter >= self.max_images:
+            return
+
+        # image array can come out as multi dimensional, take a grayscale mean
+        arr = buffer.numpy_wrap().mean(axis=2)
+
+        if self.upsample <= 1:
+            event_count, num_events = event_counting(arr, *self.params)
+
+        if self.shared is not None:
+            self.shared.begin_write()
+
+        if self.upsample > 1:
+            # centroids are added to the accumulator directly, no event map
+            num_events = event_centroiding(
+                arr, *self.params[:-1], self.upsample, self.sum_arr
+            )
+        else:
+            self.sum_arr += event_count
+
+        self.event_counter += num_events
+        self.image_counter += 1
+        if self.shared is not None:
+            self.shared.end_write(self.image_counter, self.event_counter)
+        self.telemetry.record_frame(num_events, time.perf_counter() - t0)
+        if self.image_counter == self.max_images:
+            self.stop.device_done()
+
+    def write_out(self, output_dir: str):
+        output_dir = Path(output_dir)
+        end_time = datetime.datetime.now()
+        metadata = {
+            "image_count": self.image_counter,
+            "event_count": self.event_counter,
+            "image_shape": self.sum_arr.shape,
+            "upsample": self.upsample,
+            "start_time": self._start_time.strftime("%Y/%m/%d, %H:%M:%S"),
+            "end_time": end_time.strftime("%Y/%m/%d, %H:%M:%S"),
+            "elapsed_time (s)": (end_time - self._start_time).total_seconds(),
+        }
+        np.savetxt(output_dir / "event_count.csv", self.sum_arr)
+        with open(output_dir / "metadata.json", "w") as f:
+            json.dump(metadata, f, indent=4)
+
+
+class DevicePipeline:
+    """
+    An opened grabber together with its listener, sink and telemetry
+    """
+
+    def __init__(
+        self,
+        dev_info: ic4.DeviceInfo,
+        output_dir: str | Path,
+        max_images: int,
+        stop: StopCondition,
+        telemetry_interval: float = 1.0,
+        telemetry_port: int | None = None,
+        shared_memory: bool = False,
+        **event_counting_params,
+    ):
+        self.serial = dev_info.serial
+        self.output_dir = Path(output_dir)
+
+        # Open the selected device in a new Grabber
+        self.grabber = ic4.Grabber(dev_info)
+        map = self.grabber.device_property_map
+
+        # Reset all device settings to default
+        # Not all devices support this, so ignore possible errors
+        map.try_set_value(ic4.PropId.USER_SET_SELECTOR, "Default")
+        map.try_set_value(ic4.PropId.USER_SET_LOAD, 1)
+
+        # Select FrameStart trigger (for cameras that support this)
+        map.try_set_value(ic4.PropId.TRIGGER_SELECTOR, "FrameStart")
+
+        # Enable trigger mode
+        map.set_value(ic4.PropId.TRIGGER_MODE, "On")
+
+        # Telemetry is published from a background thread, the device statistics
+        # are only polled from there so the frame path stays untouched
+        self.telemetry = Telemetry(
+            status_file=self.output_dir / "telemetry.json",
+            port=telemetry_port,
+            interval=telemetry_interval,
+            queue_depth_fn=lambda: self.sink.queue_sizes().output_queue_length,
+            dropped_frames_fn=self.dropped_frames,
+        )
+
+        shape = (
+            map.get_value_int(ic4.PropId.HEIGHT),
+            map.get_value_int(ic4.PropId.WIDTH),
+        )
+        # the accumulator is published for `ion-monitor-cli` to read in place
+        self.shared = None
+        if shared_memory:
+            upsample = event_counting_params.get("upsample", 1)
+            self.shared = SharedImage.create(
+                (shape[0] * upsample, shape[1] * upsample),
+                descriptor_path=self.output_dir / DESCRIPTOR_NAME,
+            )
+
+        self.listener = Listener(
+            shape=shape,
+            max_images=max_images,
+            stop=stop,
+            telemetry=self.telemetry,
+            shared=self.shared,
+            **event_counting_params,
+        )
+
+        # Create a QueueSink to capture all images arriving from the video capture device
+        self.sink = ic4.QueueSink(self.listener)
+
+    def dropped_frames(self) -> int:
+        stats = self.grabber.stream_statistics
+        return (
+            stats.device_transmission_error
+            + stats.device_underrun
+            + stats.transform_underrun
+            + stats.sink_underrun
+            + stats.sink_ignored
+        )
+
+    def start(self):
+        # Start the video stream into the sink
+        self.grabber.stream_setup(self.sink)
+        self.telemetry.start()
+
+    def software_trigger(self):
+        self.grabber.device_property_map.execute_command(ic4.PropId.TRIGGER_SOFTWARE)
+
+    def finish(self):
+        self.grabber.stream_stop()
+        self.telemetry.stop()
+        self.listener.write_out(output_dir=self.output_dir)
+        self.grabber.device_close()
+        if self.shared is not None:
+            self.shared.mark_done()
+            self.listener.sum_arr = None
+            self.shared.close()
+
+
+def select_device() -> ic4.DeviceInfo:
+    # Let the user select one of the connected cameras
+    device_list = ic4.DeviceEnum.devices()
+    for i, dev in enumerate(device_list):
+        print(f"[{i}] {dev.model_name} ({dev.serial}) [{dev.interface.display_name}]")
+    print(f"Select device [0..{len(device_list) - 1}]: ", end="")
+    selected_index = int(input())
+    return device_list[selected_index]
+
+
+def find_devices(serials: list[str]) -> list[ic4.DeviceInfo]:
+    devices = {dev.serial: dev for dev in ic4.DeviceEnum.devices()}
+    missing = [serial for serial in serials if serial not in devices]
+    if missing:
+        raise ValueError(
+            f"devices not connected: {missing}, available: {list(devices)}"
+        )
+    return [devices[serial] for serial in serials]
 
 
 @ic4.Library.init_context(
@@ -21,96 +264,65 @@ def process_on_trigger(
     multiply_factor,
     int_offset,
     event_size=1,
+    upsample=1,
     keyboard_control=False,
+    telemetry_interval=1.0,
+    telemetry_port=None,
+    serials=None,
+    shared_memory=False,
 ):
-    # Let the user select one of the connected cameras
-    device_list = ic4.DeviceEnum.devices()
-    for i, dev in enumerate(device_list):
-        print(f"[{i}] {dev.model_name} ({dev.serial}) [{dev.interface.display_name}]")
-    print(f"Select device [0..{len(device_list) - 1}]: ", end="")
-    selected_index = int(input())
-    dev_info = device_list[selected_index]
-
-    # Open the selected device in a new Grabber
-    grabber = ic4.Grabber(dev_info)
-    map = grabber.device_property_map
-
-    # Reset all device settings to default
-    # Not all devices support this, so ignore possible errors
-    map.try_set_value(ic4.PropId.USER_SET_SELECTOR, "Default")
-    map.try_set_value(ic4.PropId.USER_SET_LOAD, 1)
-
-    # Select FrameStart trigger (for cameras that support this)
-    map.try_set_value(ic4.PropId.TRIGGER_SELECTOR, "FrameStart")
-
-    # Enable trigger mode
-    map.set_value(ic4.PropId.TRIGGER_MODE, "On")
-
-    event = threading.Event()
-
-    # Define a listener class to receive queue sink notifications
-    class Listener(ic4.QueueSinkListener):
-        def __init__(self):
-            self._start_time = datetime.datetime.now()
-            self.image_counter = 0
-            self.event_counter = 0
-            self.sum_arr = np.zeros(
-                (
-                    grabber.device_property_map.get_value_int(ic4.PropId.HEIGHT),
-                    grabber.device_property_map.get_value_int(ic4.PropId.WIDTH),
-                )
-            )
+    """
+    Count events on every triggered frame and accumulate them until
+    `max_images` frames have been processed
 
-        def sink_connected(
-            self,
-            sink: ic4.QueueSink,
-            image_type: ic4.ImageType,
-            min_buffers_required: int,
-        ) -> bool:
-            # No need to configure anything, just accept the connection
-            return True
+    Without `serials` the device is selected interactively and the results are
+    written to `output_dir`. With `serials` every listed device is opened with
+    its own pipeline, the results of each device are written to
+    `output_dir/{serial}` and the acquisition stops once all devices are done.
+    Telemetry of the n-th device is served on `telemetry_port + n`.
 
-        def frames_queued(self, sink: ic4.QueueSink):
-            # Get the queued image buffer
-            buffer = sink.pop_output_buffer()
+    With `upsample` > 1 every event is accumulated at its sub-pixel centroid
+    on a grid `upsample` times finer than the sensor instead of painting
+    `event_size` pixels.
 
-            # image array can come out as multi dimensional, take a grayscale mean
-            arr = buffer.numpy_wrap().mean(axis=2)
+    With `shared_memory` the accumulated image of every device is published in
+    a shared memory block described by `shared_image.json` in its output
+    directory, for `ion-monitor-cli` to integrate during the acquisition.
+    """
+    if serials:
+        devices = find_devices(serials)
+        output_dirs = [Path(output_dir) / dev_info.serial for dev_info in devices]
+    else:
+        devices = [select_device()]
+        output_dirs = [Path(output_dir)]
 
-            event_count, num_events = event_counting(
-                arr, threshold, mode, nxnarea, multiply_factor, int_offset, event_size
+    stop = StopCondition(len(devices))
+    pipelines = []
+    for i, (dev_info, device_dir) in enumerate(zip(devices, output_dirs)):
+        device_dir.mkdir(parents=True, exist_ok=True)
+        pipelines.append(
+            DevicePipeline(
+                dev_info,
+                output_dir=device_dir,
+                max_images=max_images,
+                stop=stop,
+                telemetry_interval=telemetry_interval,
+                telemetry_port=None if telemetry_port is None else telemetry_port + i,
+                shared_memory=shared_memory,
+                threshold=threshold,
+                mode=mode,
+                nxnarea=nxnarea,
+                multiply_factor=multiply_factor,
+                int_offset=int_offset,
+                event_size=event_size,
+                upsample=upsample,
             )
+        )
 
-            self.sum_arr += event_count
+    for pipeline in pipelines:
+        pipeline.start()
+        print(f"    >Stream started: {pipeline.serial} -> {pipeline.output_dir}")
 
-            self.event_counter += num_events
-            self.image_counter += 1
-            if self.image_counter == max_images:
-                event.set()
-
-        def write_out(self, output_dir: str):
-            output_dir = Path(output_dir)
-            end_time = datetime.datetime.now()
-            metadata = {
-                "image_count": self.image_counter,
-                "event_count": self.event_counter,
-                "image_shape": self.sum_arr.shape,
-                "start_time": self._start_time.strftime("%Y/%m/%d, %H:%M:%S"),
-                "end_time": end_time.strftime("%Y/%m/%d, %H:%M:%S"),
-                "elapsed_time (s)": (end_time - self._start_time).total_seconds(),
-            }
-            np.savetxt(output_dir / "event_count.csv", self.sum_arr)
-            with open(output_dir / "metadata.json", "w") as f:
-                json.dump(metadata, f, indent=4)
-
-    # Create an instance of the listener type defined above
-    listener = Listener()
-
-    # Create a QueueSink to capture all images arriving from the video capture device
-    sink = ic4.QueueSink(listener)
-
-    # Start the video stream into the sink
-    grabber.stream_setup(sink)
     msg = "Input hardware triggers"
     if keyboard_control:
         msg += ", or press ENTER to issue a software trigger"
@@ -124,10 +336,9 @@ def process_on_trigger(
     # define asynchronous thread worker that waits for an event to be set to end the program
     # this event can be set from various locations under various conditions
     def worker():
-        event.wait()
-        grabber.stream_stop()
-        listener.write_out(output_dir=output_dir)
-        grabber.device_close()
+        stop.event.wait()
+        for pipeline in pipelines:
+            pipeline.finish()
 
     thread = threading.Thread(target=worker)
     thread.start()
@@ -135,7 +346,8 @@ def process_on_trigger(
     # keyboard exiting can also be set with a thread in the future
     if keyboard_control:
         while input() != "q":
-            map.execute_command(ic4.PropId.TRIGGER_SOFTWARE)
-        event.set()
+            for pipeline in pipelines:
+                pipeline.software_trigger()
+        stop.event.set()
 
     thread.join()
@@ -0,0 +1,177 @@
+import bisect
+import datetime
+import json
+import os
+import socketserver
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+# upper edges of the processing latency histogram bins in milliseconds, the
+# final bin collects everything slower than the last edge
+LATENCY_BIN_EDGES_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Telemetry:
+    """
+    Live statistics for an acquisition loop
+
+    The frame callback only calls `record_frame`, which updates a handful of
+    counters. Everything else (rates, queue depth, dropped frames, writing the
+    status file, serving the socket) happens on a background thread so the
+    frame path is not slowed down.
+
+    Args:
+        status_file: JSON file rewritten with the latest snapshot every interval
+        port: if set, serve the latest snapshot as JSON on `localhost:port`
+        interval: seconds between snapshots
+        window: number of frames in the events/frame moving average
+        queue_depth_fn: callable returning the number of frames waiting to be
+            processed, polled from the background thread
+        dropped_frames_fn: callable returning the number of frames dropped so
+            far, polled from the background thread
+    """
+
+    def __init__(
+        self,
+        status_file: str | Path | None = None,
+        port: int | None = None,
+        interval: float = 1.0,
+        window: int = 100,
+        queue_depth_fn: Callable[[], int] | None = None,
+        dropped_frames_fn: Callable[[], int] | None = None,
+    ):
+        self.status_file = None if status_file is None else Path(status_file)
+        self.port = port
+        self.interval = interval
+        self.queue_depth_fn = queue_depth_fn
+        self.dropped_frames_fn = dropped_frames_fn
+
+        self.image_count = 0
+        self.event_count = 0
+        self._alpha = 2 / (window + 1)
+        self._events_ema = 0.0
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+        self._latency_counts = [0] * (len(LATENCY_BIN_EDGES_MS) + 1)
+
+        self._start_time = time.perf_counter()
+        self._last_time = self._start_time
+        self._last_count = 0
+        self._snapshot = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+
+    def record_frame(self, num_events: int, latency: float):
+        """
+        Record a processed frame, called from the frame callback
+
+        Args:
+            num_events: number of events counted in the frame
+            latency: processing time of the frame in seconds
+        """
+        latency_ms = latency * 1000
+        self._latency_counts[bisect.bisect_left(LATENCY_BIN_EDGES_MS, latency_ms)] += 1
+        self._latency_sum += latency_ms
+        if latency_ms > self._latency_max:
+            self._latency_max = latency_ms
+
+        if self.image_count == 0:
+            self._events_ema = float(num_events)
+        else:
+            self._events_ema += self._alpha * (num_events - self._events_ema)
+        self.event_count += num_events
+        self.image_count += 1
+
+    def snapshot(self) -> dict:
+        """
+        Build a snapshot of the current statistics
+        """
+        now = time.perf_counter()
+        image_count = self.image_count
+        elapsed = now - self._start_time
+        dt = now - self._last_time
+        recent_fps = (image_count - self._last_count) / dt if dt > 0 else 0.0
+        self._last_time, self._last_count = now, image_count
+
+        return {
+            "updated_at": datetime.datetime.now().strftime("%Y/%m/%d, %H:%M:%S"),
+            "elapsed_time (s)": elapsed,
+            "image_count": image_count,
+            "event_count": self.event_count,
+            "frames_per_sec": recent_fps,
+            "mean_frames_per_sec": image_count / elapsed if elapsed > 0 else 0.0,
+            "events_per_frame": self._events_ema,
+            "latency_ms": {
+                "mean": self._latency_sum / image_count if image_count else 0.0,
+                "max": self._latency_max,
+                "bin_edges": list(LATENCY_BIN_EDGES_MS),
+                "counts": list(self._latency_counts),
+            },
+            "queue_depth": _poll(self.queue_depth_fn),
+            "dropped_frames": _poll(self.dropped_frames_fn),
+        }
+
+    def publish(self):
+        self._snapshot = self.snapshot()
+        if self.status_file is None:
+            return
+
+        # write to a temporary file first so readers never see a partial file
+        tmp = self.status_file.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self._snapshot, f, indent=4)
+        os.replace(tmp, self.status_file)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        if self.port is not None:
+            self._server = _SnapshotServer(("127.0.0.1", self.port), self)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            print(f"    >Telemetry served on localhost:{self.port}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        # final snapshot so the status file reflects the complete run
+        self.publish()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.publish()
+
+
+class _SnapshotHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        data = json.dumps(self.server.telemetry._snapshot) + "\n"
+        self.wfile.write(data.encode())
+
+
+class _SnapshotServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, telemetry: Telemetry):
+        self.telemetry = telemetry
+        super().__init__(address, _SnapshotHandler)
+
+
+def _poll(fn: Callable[[], int] | None) -> int | None:
+    if fn is None:
+        return None
+    try:
+        return fn()
+    except Exception:
+        # device statistics are best effort, never break telemetry over them
+        return None
@@ -1,2 +1,6 @@
 from .constants import RawIndices, PeakIndices
 from .tof_data import TofData, TofExperimentData
+from .store import TofPeakStore
+from .catalog import TofCatalog
+from .profiling import Profiler
+from .sweep import TofSweep
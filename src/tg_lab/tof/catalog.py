@@ -0,0 +1,136 @@
+from pathlib import Path
+
+import polars as pl
+
+from . import file_utils
+from .constants import ExperimentIndices
+
+PATH = "path"
+
+
+class TofCatalog:
+    """
+    Index of the trace files of an experiment built from their names only
+
+    Every row maps (title, reaction time, run) to a file path. Selections and
+    exclusions filter the index, and only the files left are read once their
+    traces are requested. Loaded traces are kept in a cache shared by every
+    catalog derived from the same directory, so a trace is parsed at most
+    once.
+    """
+
+    def __init__(self, index: pl.DataFrame, cache: dict | None = None):
+        self.index = index
+        self._cache = {} if cache is None else cache
+
+    @classmethod
+    def from_directory(cls, path: str | Path, glob: str = r"**\*.txt"):
+        return cls.from_files(file_utils.get_files(path, glob=glob))
+
+    @classmethod
+    def from_files(cls, files):
+        rows = []
+        for f in files:
+            title, time, run = file_utils.parse_file_path(f)
+            rows.append((title, float(time), int(run), str(f)))
+
+        index = pl.DataFrame(
+            rows,
+            schema={
+                ExperimentIndices.TITLE.value: pl.String,
+                ExperimentIndices.REACTION_TIME.value: pl.Float64,
+                ExperimentIndices.RUN.value: pl.Int64,
+                PATH: pl.String,
+            },
+            orient="row",
+        ).sort(ExperimentIndices.REACTION_TIME.value, ExperimentIndices.RUN.value)
+        return cls(index)
+
+    def __len__(self):
+        return self.index.height
+
+    def _derive(self, index: pl.DataFrame):
+        return type(self)(index, cache=self._cache)
+
+    @property
+    def paths(self) -> list[str]:
+        return self.index[PATH].to_list()
+
+    def get_keys(self):
+        """
+        Runs of every reaction time, like `TofExperimentData.get_keys`
+        """
+        keys = self.index.group_by(
+            ExperimentIndices.REACTION_TIME.value, maintain_order=True
+        ).agg(pl.col(ExperimentIndices.RUN.value).sort())
+        return dict(keys.iter_rows())
+
+    def select(
+        self,
+        t: float | int | list[float] | None = None,
+        runs: list[int] | None = None,
+        title: str | None = None,
+    ):
+        """
+        Catalog of the traces at the reaction time(s) `t`, with the given runs
+        and title, every unset criterion matches everything
+        """
+        predicates = []
+        if t is not None:
+            times = t if isinstance(t, list) else [t]
+            predicates.append(
+                pl.col(ExperimentIndices.REACTION_TIME.value).is_in(
+                    [float(x) for x in times]
+                )
+            )
+        if runs is not None:
+            predicates.append(pl.col(ExperimentIndices.RUN.value).is_in(runs))
+        if title is not None:
+            predicates.append(pl.col(ExperimentIndices.TITLE.value) == title)
+
+        if not predicates:
+            return self
+        return self._derive(self.index.filter(*predicates))
+
+    def exclude(self, exclusions: dict[float, list[int]]):
+        """
+        Catalog without the excluded runs, see `Config.exclusions`
+        """
+        excluded = [(float(t), int(r)) for t, runs in exclusions.items() for r in runs]
+        if not excluded:
+            return self
+
+        excluded = pl.DataFrame(
+            excluded,
+            schema={
+                ExperimentIndices.REACTION_TIME.value: pl.Float64,
+                ExperimentIndices.RUN.value: pl.Int64,
+            },
+            orient="row",
+        )
+        return self._derive(
+            self.index.join(
+                excluded,
+                on=[ExperimentIndices.REACTION_TIME.value, ExperimentIndices.RUN.value],
+                how="anti",
+                maintain_order="left",
+            )
+        )
+
+    def load(self) -> list:
+        """
+        Traces of every file in the catalog, files are only parsed on their
+        first request
+
+        Returns:
+            (list[TofData]): traces in reaction time and run order
+        """
+        # imported here, `tof_data` builds catalogs itself
+        from .tof_data import TofData
+
+        data = []
+        for path in self.paths:
+            if path not in self._cache:
+                self._cache[path] = TofData.from_file(path)
+            data.append(self._cache[path])
+        return data
@@ -27,3 +27,26 @@ class PeakIndices(str, Enum):
     MZ = RawIndices.MZ.value
     ION = "ion"
     MZ_SPAN = "m/z_span"
+    FIT_AREA = "fit_area"
+    FIT_CENTER = "fit_center"
+    FIT_WIDTH = "fit_width"
+    FIT_RESIDUAL = "fit_residual"
+
+
+class OutputFormats(str, Enum):
+
+    CSV = "csv"
+    PARQUET = "parquet"
+    IPC = "ipc"
+
+
+class ProcessingBackends(str, Enum):
+
+    POLARS = "polars"
+    NUMBA = "numba"
+
+
+class PeakModels(str, Enum):
+
+    GAUSSIAN = "gaussian"
+    EMG = "emg"
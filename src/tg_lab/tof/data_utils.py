@@ -1,6 +1,8 @@
-from .constants import RawIndices
+import numpy as np
 import polars as pl
 
+from .constants import ExperimentIndices, PeakIndices, RawIndices
+
 
 def find_peak(data, mz_range, threshold):
     col = pl.col(RawIndices.SIGNAL.value)
@@ -27,3 +29,89 @@ def filter_by_mz_range(data: pl.DataFrame, mz_range: tuple[float]):
     x_min, x_max = mz_range
     col = pl.col(RawIndices.MZ.value)
     return data.filter((col > x_min) & (col < x_max))
+
+
+def get_normalization(peak_data: pl.DataFrame | pl.LazyFrame, by: list[str] = []):
+    """
+    Total peak sum of every (reaction time, run), eager or lazy, separately
+    for every combination of the extra `by` columns
+    """
+    return peak_data.group_by(
+        [*by, ExperimentIndices.REACTION_TIME.value, RawIndices.RUN.value]
+    ).agg(pl.col(PeakIndices.SUM.value).sum().alias(ExperimentIndices.NORM.value))
+
+
+def normalize_peak_data(peak_data: pl.DataFrame | pl.LazyFrame, by: list[str] = []):
+    """
+    Add the normalization and each peak sum divided by it, eager or lazy
+    """
+    norm = get_normalization(peak_data, by=by)
+    return peak_data.join(
+        norm, [*by, ExperimentIndices.REACTION_TIME.value, RawIndices.RUN.value]
+    ).with_columns(
+        (
+            pl.col(PeakIndices.SUM.value)
+            / pl.col(ExperimentIndices.NORM.value)
+        ).alias(ExperimentIndices.NORM_SUM.value)
+    )
+
+
+def aggregate_peak_data(
+    peak_data: pl.DataFrame | pl.LazyFrame, col: str, by: list[str] = []
+):
+    """
+    Statistics of `col` per (ion, reaction time), eager or lazy, separately
+    for every combination of the extra `by` columns
+    """
+    group_by_cols = [*by, PeakIndices.ION.value, ExperimentIndices.REACTION_TIME.value]
+    agg_col = pl.col(col)
+    return (
+        peak_data
+        .group_by(group_by_cols)
+        .agg(
+            agg_col.mean().alias("mean"),
+            agg_col.std().alias("std"),
+            agg_col.sum().alias("sum"),
+            agg_col.count().alias("count")
+        )
+        .sort(group_by_cols)
+    )
+
+
+def decimate_minmax(x, y, n_bins, xlim=None):
+    """
+    Reduce a line to the minimum and maximum sample of each of `n_bins` equal
+    width columns of x over `xlim`, in their original order. x is binned
+    rather than the sample index, as m/z samples are not evenly spaced. Drawn
+    at a pixel width of `n_bins` the result is indistinguishable from the
+    full line.
+
+    Args:
+        x: sample positions
+        y: sample values
+        n_bins: number of columns, the width of the plot in pixels
+        xlim: (min, max) x range the columns divide, defaults to the data range
+
+    Returns:
+        (tuple[np.array, np.array]): x and y of the kept samples
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(y) <= 2 * n_bins:
+        return x, y
+
+    x0, x1 = (x.min(), x.max()) if xlim is None else xlim
+    width = x1 - x0 if x1 > x0 else 1
+    columns = np.floor((x - x0) / width * n_bins).astype(np.int64)
+    # the right edge belongs to the last column
+    columns = np.clip(columns, 0, n_bins - 1)
+
+    # samples ordered by column then value, the ends of every column's run
+    # are its minimum and maximum
+    order = np.lexsort((y, columns))
+    sorted_columns = columns[order]
+    starts = np.flatnonzero(np.diff(sorted_columns, prepend=-1))
+    ends = np.append(starts[1:], len(order)) - 1
+
+    indices = np.unique(np.concatenate([order[starts], order[ends]]))
+    return x[indices], y[indices]
@@ -4,8 +4,9 @@ import json
 import os
 
 import numpy as np
+import polars as pl
 
-from .constants import RawIndices
+from .constants import OutputFormats, PeakIndices, RawIndices
 
 
 def get_files(path: str | Path, glob=r"**\*.txt"):
@@ -58,3 +59,32 @@ def parse_data(path: str | Path):
 def write_json(path, data):
     with open(Path(path), "w") as f:
         json.dump(data, f, indent=4)
+
+
+def write_table(
+    path: str | Path,
+    table: pl.DataFrame,
+    output_format: OutputFormats = OutputFormats.CSV,
+    partition_by: str | None = None,
+):
+    """
+    Write a table to `path` with the suffix of the output format
+
+    Parquet tables are zstd compressed, with `partition_by` they are written
+    as a `{path}/{partition_by}={value}/` directory layout instead of a file
+    """
+    path = Path(path)
+    if output_format == OutputFormats.CSV:
+        # drop MZ_SPAN because it's a tuple and csv's cannot handle that structure
+        if PeakIndices.MZ_SPAN.value in table.columns:
+            table = table.drop(PeakIndices.MZ_SPAN.value)
+        table.write_csv(path.with_suffix(".csv"))
+    elif output_format == OutputFormats.PARQUET:
+        if partition_by is None:
+            table.write_parquet(path.with_suffix(".parquet"), compression="zstd")
+        else:
+            table.write_parquet(path, compression="zstd", partition_by=partition_by)
+    elif output_format == OutputFormats.IPC:
+        table.write_ipc(path.with_suffix(".arrow"), compression="zstd")
+    else:
+        raise ValueError(f"unsupported output format: {output_format}")
@@ -0,0 +1,221 @@
+import numpy as np
+import polars as pl
+
+from .constants import PeakIndices, PeakModels, RawIndices
+
+SQRT_2PI = np.sqrt(2 * np.pi)
+FWHM_PER_SIGMA = 2 * np.sqrt(2 * np.log(2))
+
+
+def gaussian(x, params):
+    """
+    Gaussian peak with area, center, log width and a constant baseline
+
+    Args:
+        x: (B, N) sample positions
+        params: (B, 4) parameters (area, center, log(sigma), baseline)
+    """
+    area, center, log_sigma, baseline = (params[:, i : i + 1] for i in range(4))
+    sigma = np.exp(log_sigma)
+    d = (x - center) / sigma
+    return area / (sigma * SQRT_2PI) * np.exp(-0.5 * d * d) + baseline
+
+
+def emg(x, params):
+    """
+    Exponentially modified gaussian peak with a tail towards higher m/z
+
+    Args:
+        x: (B, N) sample positions
+        params: (B, 5) parameters (area, center, log(sigma), log(tau), baseline)
+    """
+    from scipy.special import erfc, erfcx
+
+    area, center, log_sigma, log_tau, baseline = (
+        params[:, i : i + 1] for i in range(5)
+    )
+    sigma = np.exp(log_sigma)
+    lam = np.exp(-log_tau)
+    d = x - center
+    z = (lam * sigma - d / sigma) / np.sqrt(2)
+
+    # erfcx keeps the right side of the peak finite, erfc the left side
+    with np.errstate(over="ignore", invalid="ignore"):
+        right = np.exp(-0.5 * (d / sigma) ** 2) * erfcx(np.maximum(z, 0))
+        left = np.exp(np.minimum(lam * (0.5 * lam * sigma**2 - d), 700)) * erfc(z)
+    pdf = 0.5 * lam * np.where(z >= 0, right, left)
+    return area * pdf + baseline
+
+
+_models = {
+    PeakModels.GAUSSIAN.value: gaussian,
+    PeakModels.EMG.value: emg,
+}
+
+
+def levenberg_marquardt(model, x, y, weights, p0, max_iter=50, tol=1e-10):
+    """
+    Least squares fit of a batch of independent problems at once
+
+    Every problem keeps its own damping factor and only accepts steps that
+    reduce its cost. Jacobians are forward differences evaluated for the
+    whole batch.
+
+    Args:
+        model: callable (x, params) -> predictions for the whole batch
+        x: (B, N) sample positions, padded
+        y: (B, N) samples, padded
+        weights: (B, N) sample weights, 0 for padding
+        p0: (B, P) initial parameters
+        max_iter: maximum number of iterations
+        tol: relative cost change below which a problem counts as converged
+
+    Returns:
+        (tuple[np.array, np.array]): fitted parameters and weighted cost
+    """
+    params = p0.astype(np.float64).copy()
+    num_params = params.shape[1]
+    damping = np.full(len(params), 1e-3)
+
+    residual = weights * (y - model(x, params))
+    cost = (residual**2).sum(axis=1)
+
+    for _ in range(max_iter):
+        f0 = model(x, params)
+        jac = np.empty((*x.shape, num_params))
+        for k in range(num_params):
+            h = 1e-7 * np.maximum(np.abs(params[:, k]), 1)
+            shifted = params.copy()
+            shifted[:, k] += h
+            jac[..., k] = (model(x, shifted) - f0) / h[:, None]
+        jac *= weights[..., None]
+
+        jtj = np.einsum("bnp,bnq->bpq", jac, jac)
+        grad = np.einsum("bnp,bn->bp", jac, residual)
+        diag = np.einsum("bpp->bp", jtj)
+        lhs = jtj + (damping[:, None] * diag + 1e-12)[..., None] * np.eye(num_params)
+        step = np.linalg.solve(lhs, grad[..., None])[..., 0]
+
+        candidate = params + step
+        with np.errstate(over="ignore", invalid="ignore"):
+            new_residual = weights * (y - model(x, candidate))
+            new_cost = (new_residual**2).sum(axis=1)
+        improved = np.isfinite(new_cost) & (new_cost < cost)
+
+        change = np.where(improved, (cost - new_cost) / np.maximum(cost, 1e-300), 0)
+        params[improved] = candidate[improved]
+        residual[improved] = new_residual[improved]
+        cost = np.where(improved, new_cost, cost)
+        damping = np.where(improved, damping / 10, damping * 10)
+
+        if np.all((change < tol) & (improved | (damping > 1e10))):
+            break
+
+    return params, cost
+
+
+def _half_width_samples(signal: np.array, peak_index: int) -> int:
+    """
+    Number of contiguous samples around `peak_index` at which the signal is
+    at least half as far from zero as the peak, in the peak's direction
+    """
+    half = 0.5 * signal[peak_index]
+    beyond = signal * np.sign(half) >= abs(half)
+    last = len(signal) - 1
+    i = j = peak_index
+    while i < last and beyond[i + 1]:
+        i += 1
+    while j > 0 and beyond[j - 1]:
+        j -= 1
+    return i - j + 1
+
+
+def fit_peaks(data: list, config) -> list:
+    """
+    Fit a peak shape to every found peak of every trace in one batch
+
+    Each fit uses the samples of the ion's peak detection window. The width
+    is seeded from the measured full width at half maximum of the peak, and
+    the area from the peak signal of a gaussian of that width. For the
+    exponentially modified gaussian the tail starts as long as the width.
+
+    The model is fitted in m/z, so its area is in m/z times signal. The area
+    is divided by the mean m/z spacing of the window before it is stored as
+    `fit_area`, which puts it in the units of `sum`, a sum over samples.
+    `fit_center` and `fit_width` (sigma) are in m/z, `fit_residual` is the
+    root mean square residual in signal units.
+
+    Args:
+        data: list of processed `TofData`
+        config: `Config` with the fit model in `fit_params`
+
+    Returns:
+        (list[TofData]): the traces with the fit columns added
+    """
+    model_name = config.fit_params.model
+    model = _models[model_name]
+    ranges = config.peak_params.get_peak_ranges()
+
+    windows, seeds, spacings, owners = [], [], [], []
+    for t, td in enumerate(data):
+        if td.peak_data.is_empty():
+            continue
+        mz = td.raw_data[RawIndices.MZ.value].to_numpy()
+        signal = td.raw_data[RawIndices.SIGNAL.value].to_numpy()
+        for row in td.peak_data.iter_rows(named=True):
+            x_min, x_max = ranges[row[PeakIndices.ION.value]]
+            inside = (mz > x_min) & (mz < x_max)
+            wx, wy = mz[inside], signal[inside]
+            windows.append((wx, wy))
+
+            spacing = (wx[-1] - wx[0]) / (len(wx) - 1) if len(wx) > 1 else 1.0
+            peak_index = int(np.argmin(np.abs(wx - row[PeakIndices.MZ.value])))
+            fwhm = _half_width_samples(wy, peak_index) * spacing
+            sigma0 = fwhm / FWHM_PER_SIGMA
+
+            seed = [
+                row[PeakIndices.SIGNAL.value] * sigma0 * SQRT_2PI,
+                row[PeakIndices.MZ.value],
+                np.log(sigma0),
+            ]
+            if model_name == PeakModels.EMG:
+                seed.append(np.log(sigma0))
+            seed.append(0.0)
+            seeds.append(seed)
+            spacings.append(spacing)
+            owners.append(t)
+
+    if not windows:
+        return data
+
+    size = max(len(w[0]) for w in windows)
+    x = np.zeros((len(windows), size))
+    y = np.zeros((len(windows), size))
+    weights = np.zeros((len(windows), size))
+    for i, (wx, wy) in enumerate(windows):
+        x[i, : len(wx)] = wx
+        y[i, : len(wy)] = wy
+        weights[i, : len(wx)] = 1
+        # padding repeats the last position so the model stays finite there
+        x[i, len(wx) :] = wx[-1] if len(wx) else 0
+
+    params, cost = levenberg_marquardt(
+        model, x, y, weights, np.array(seeds), max_iter=config.fit_params.max_iter
+    )
+    counts = np.maximum(weights.sum(axis=1), 1)
+    columns = {
+        PeakIndices.FIT_AREA.value: params[:, 0] / np.array(spacings),
+        PeakIndices.FIT_CENTER.value: params[:, 1],
+        PeakIndices.FIT_WIDTH.value: np.exp(params[:, 2]),
+        PeakIndices.FIT_RESIDUAL.value: np.sqrt(cost / counts),
+    }
+
+    owners = np.array(owners)
+    res = list(data)
+    for t in np.unique(owners):
+        rows = owners == t
+        fit = pl.DataFrame({name: col[rows] for name, col in columns.items()})
+        peak_data = pl.concat([data[t].peak_data, fit], how="horizontal")
+        res[t] = data[t].copy(peak_data=peak_data)
+
+    return res
@@ -0,0 +1,244 @@
+import numpy as np
+import polars as pl
+from numba import njit, prange
+
+from .constants import PeakIndices, RawIndices
+
+
+@njit(nogil=True)
+def _mean_std(mz, signal, offset, x_min, x_max):
+    """
+    Mean and sample standard deviation of `signal - offset` where
+    x_min < mz < x_max, nan when there are too few samples
+    """
+    n = 0
+    total = 0.0
+    for k in range(len(signal)):
+        if mz[k] > x_min and mz[k] < x_max:
+            total += signal[k] - offset
+            n += 1
+    if n == 0:
+        return np.nan, np.nan
+
+    mean = total / n
+    if n == 1:
+        return mean, np.nan
+
+    ss = 0.0
+    for k in range(len(signal)):
+        if mz[k] > x_min and mz[k] < x_max:
+            d = signal[k] - offset - mean
+            ss += d * d
+    return mean, np.sqrt(ss / (n - 1))
+
+
+@njit(nogil=True)
+def _find_peak(mz, signal, x_min, x_max, threshold):
+    """
+    Index of the minimum of `signal` where x_min < mz < x_max, the middle one
+    of several equal minima, or -1 if the minimum is not below the threshold
+    """
+    minimum = np.inf
+    count = 0
+    for k in range(len(signal)):
+        if mz[k] > x_min and mz[k] < x_max:
+            if signal[k] < minimum:
+                minimum = signal[k]
+                count = 1
+            elif signal[k] == minimum:
+                count += 1
+    if count == 0 or not minimum < threshold:
+        return -1
+
+    target = count // 2
+    seen = 0
+    for k in range(len(signal)):
+        if mz[k] > x_min and mz[k] < x_max and signal[k] == minimum:
+            if seen == target:
+                return k
+            seen += 1
+    return -1
+
+
+@njit(nogil=True)
+def _integrate_peak(signal, peak_index):
+    """
+    Sum of the signal between the nearest non-negative samples on both sides
+    of the peak, those samples included, see `data_utils.integrate_peak`
+    """
+    last = len(signal) - 1
+    i = peak_index
+    j = peak_index
+    while i < last and signal[i] < 0:
+        i += 1
+    while j > 0 and signal[j] < 0:
+        j -= 1
+
+    total = 0.0
+    for k in range(j, i + 1):
+        total += signal[k]
+    return total, j, i
+
+
+@njit(parallel=True)
+def _process_traces(
+    tof_time, signal, a, b, c, bkg_min, bkg_max, sigma, peak_mins, peak_maxs
+):
+    num_traces, num_samples = signal.shape
+    num_peaks = len(peak_mins)
+
+    mz = np.empty_like(signal)
+    normalized = np.empty_like(signal)
+    bkg_stats = np.empty((num_traces, 2))
+    peak_rows = np.full((num_traces, num_peaks), -1, dtype=np.int64)
+    peak_sums = np.full((num_traces, num_peaks), np.nan)
+    peak_spans = np.full((num_traces, num_peaks, 2), -1, dtype=np.int64)
+
+    for m in prange(num_traces):
+        for k in range(num_samples):
+            mz[m, k] = a * (tof_time[m, k] - b) ** 2 + c
+
+        offset, _ = _mean_std(mz[m], signal[m], 0.0, bkg_min, bkg_max)
+        for k in range(num_samples):
+            normalized[m, k] = signal[m, k] - offset
+
+        mean, std = _mean_std(mz[m], normalized[m], 0.0, bkg_min, bkg_max)
+        bkg_stats[m, 0] = mean
+        bkg_stats[m, 1] = std
+        threshold = mean - sigma * std
+
+        for p in range(num_peaks):
+            row = _find_peak(mz[m], normalized[m], peak_mins[p], peak_maxs[p], threshold)
+            if row < 0:
+                continue
+            total, j, i = _integrate_peak(normalized[m], row)
+            peak_rows[m, p] = row
+            peak_sums[m, p] = total
+            peak_spans[m, p, 0] = j
+            peak_spans[m, p, 1] = i
+
+    return mz, normalized, bkg_stats, peak_rows, peak_sums, peak_spans
+
+
+@njit(parallel=True)
+def _sweep_traces(mz, signal, bkg_min, bkg_max, peak_mins, peak_maxs):
+    """
+    Background statistics, peak minima and peak sums of every trace for one
+    background range and set of peak windows, without a detection threshold
+
+    The minimum of a window does not depend on the threshold, so a single
+    pass serves every `PeakParams.sigma`: a peak is found for a sigma when
+    its minimum is below `mean - sigma * std`.
+    """
+    num_traces, num_samples = signal.shape
+    num_peaks = len(peak_mins)
+
+    bkg_stats = np.empty((num_traces, 2))
+    peak_values = np.full((num_traces, num_peaks), np.nan)
+    peak_sums = np.full((num_traces, num_peaks), np.nan)
+
+    for m in prange(num_traces):
+        offset, _ = _mean_std(mz[m], signal[m], 0.0, bkg_min, bkg_max)
+        normalized = signal[m] - offset
+        mean, std = _mean_std(mz[m], normalized, 0.0, bkg_min, bkg_max)
+        bkg_stats[m, 0] = mean
+        bkg_stats[m, 1] = std
+
+        for p in range(num_peaks):
+            row = _find_peak(mz[m], normalized, peak_mins[p], peak_maxs[p], np.inf)
+            if row < 0:
+                continue
+            total, _, _ = _integrate_peak(normalized, row)
+            peak_values[m, p] = normalized[row]
+            peak_sums[m, p] = total
+
+    return bkg_stats, peak_values, peak_sums
+
+
+def process_traces(data: list, config) -> list:
+    """
+    Compiled equivalent of calling `TofData.process` on every trace
+
+    m/z conversion, background statistics, normalization, peak search and
+    peak integration run in a single parallel pass over a matrix of traces.
+    Traces are grouped by length, and ions without a peak below the detection
+    threshold are left out of `peak_data` instead of raising.
+
+    Args:
+        data: list of unprocessed `TofData`
+        config: `Config` to process the traces with
+
+    Returns:
+        (list[TofData]): processed traces in the input order
+    """
+    names = list(config.peak_params.get_peak_ranges())
+    ranges = np.array(
+        list(config.peak_params.get_peak_ranges().values()), dtype=np.float64
+    ).reshape(-1, 2)
+    mz_params = config.mz_params
+
+    by_length = {}
+    for index, td in enumerate(data):
+        by_length.setdefault(td.raw_data.height, []).append(index)
+
+    res = [None] * len(data)
+    for indices in by_length.values():
+        tof_time = np.stack(
+            [data[i].raw_data[RawIndices.TOF_TIME.value].to_numpy() for i in indices]
+        ).astype(np.float64)
+        signal = np.stack(
+            [data[i].raw_data[RawIndices.SIGNAL.value].to_numpy() for i in indices]
+        ).astype(np.float64)
+
+        mz, normalized, bkg_stats, peak_rows, peak_sums, peak_spans = _process_traces(
+            tof_time,
+            signal,
+            mz_params.a,
+            mz_params.b,
+            mz_params.c,
+            config.bkg_params.x_min,
+            config.bkg_params.x_max,
+            config.peak_params.sigma,
+            ranges[:, 0],
+            ranges[:, 1],
+        )
+
+        for m, i in enumerate(indices):
+            td = data[i]
+            raw_data = td.raw_data.with_columns(
+                pl.Series(RawIndices.SIGNAL.value, normalized[m]),
+                pl.Series(RawIndices.MZ.value, mz[m]),
+            )
+            res[i] = td.copy(
+                raw_data=raw_data,
+                peak_data=_peak_frame(
+                    names,
+                    tof_time[m],
+                    normalized[m],
+                    mz[m],
+                    peak_rows[m],
+                    peak_sums[m],
+                    peak_spans[m],
+                ),
+                config=config,
+                bkg_stats=(bkg_stats[m, 0], bkg_stats[m, 1]),
+            )
+
+    return res
+
+
+def _peak_frame(names, tof_time, signal, mz, rows, sums, spans):
+    found = rows >= 0
+    rows, sums, spans = rows[found], sums[found], spans[found]
+    return pl.DataFrame(
+        {
+            PeakIndices.ROW_NR.value: rows,
+            PeakIndices.TOF_TIME.value: tof_time[rows],
+            PeakIndices.SIGNAL.value: signal[rows],
+            PeakIndices.MZ.value: mz[rows],
+            PeakIndices.ION.value: [n for n, f in zip(names, found) if f],
+            PeakIndices.SUM.value: sums,
+            PeakIndices.MZ_SPAN.value: mz[spans].tolist(),
+        },
+        schema_overrides={PeakIndices.MZ_SPAN.value: pl.List(pl.Float64)},
+    )
@@ -0,0 +1,195 @@
+import contextvars
+import functools
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+import polars as pl
+
+from . import file_utils
+
+# profiler collecting the stage records of the current context, None disables
+# profiling and leaves a single lookup per instrumented call
+_active = contextvars.ContextVar("tof_profiler", default=None)
+
+
+class Profiler:
+    """
+    Opt-in instrumentation of the TOF processing stages
+
+    While the profiler is entered, every instrumented stage records its wall
+    time and the bytes allocated during it, tagged with the trace it ran on.
+    Stages nest, e.g. `find_peaks` includes its `get_bkg_stats` call.
+
+    Allocated bytes are the net growth of the memory traced by `tracemalloc`,
+    which covers python and numpy but not polars' own allocator.
+
+    Args:
+        trace_memory: trace allocations with `tracemalloc`, which slows down
+            python heavy stages
+        callback: called with every record as it is taken
+
+    Example:
+        with Profiler() as profiler:
+            ted.save_data()
+        print(profiler.summary())
+    """
+
+    def __init__(self, trace_memory: bool = True, callback: Callable | None = None):
+        self.trace_memory = trace_memory
+        self.callback = callback
+        self.records = []
+        self.wall_time = 0.0
+        self._token = None
+        self._started_tracing = False
+        self._start = None
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._token = _active.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall_time += time.perf_counter() - self._start
+        _active.reset(self._token)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _memory(self):
+        if self.trace_memory and tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[0]
+        return 0
+
+    def record(self, stage: str, trace: str | None, seconds: float, allocated: int):
+        record = {
+            "stage": stage,
+            "trace": trace,
+            "seconds": seconds,
+            "allocated_bytes": allocated,
+        }
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def get_records(self) -> pl.DataFrame:
+        return pl.DataFrame(
+            self.records,
+            schema={
+                "stage": pl.String,
+                "trace": pl.String,
+                "seconds": pl.Float64,
+                "allocated_bytes": pl.Int64,
+            },
+        )
+
+    def summary(self) -> pl.DataFrame:
+        """
+        Calls, wall time and allocated bytes per stage, slowest stage first
+        """
+        return (
+            self.get_records()
+            .group_by("stage", maintain_order=True)
+            .agg(
+                pl.len().alias("calls"),
+                pl.col("seconds").sum().alias("total_s"),
+                pl.col("seconds").mean().alias("mean_s"),
+                pl.col("seconds").max().alias("max_s"),
+                pl.col("allocated_bytes").sum(),
+            )
+            .with_columns(
+                (pl.col("total_s") / max(self.wall_time, 1e-12)).alias("wall_fraction")
+            )
+            .sort("total_s", descending=True, maintain_order=True)
+        )
+
+    def per_trace(self) -> pl.DataFrame:
+        """
+        Calls, wall time and allocated bytes per stage and trace
+        """
+        return (
+            self.get_records()
+            .filter(pl.col("trace").is_not_null())
+            .group_by("trace", "stage", maintain_order=True)
+            .agg(
+                pl.len().alias("calls"),
+                pl.col("seconds").sum().alias("total_s"),
+                pl.col("allocated_bytes").sum(),
+            )
+        )
+
+    def report(self) -> dict:
+        return {
+            "wall_time_s": self.wall_time,
+            "trace_memory": self.trace_memory,
+            "stages": self.summary().to_dicts(),
+            "traces": self.per_trace().to_dicts(),
+        }
+
+    def save(self, path: str | Path):
+        """
+        Write `profile.json` and `profile_summary.csv` to the directory `path`
+        """
+        path = Path(path)
+        file_utils.write_json(path / "profile.json", self.report())
+        self.summary().write_csv(path / "profile_summary.csv")
+
+
+def get_profiler() -> Profiler | None:
+    return _active.get()
+
+
+@contextmanager
+def stage(name: str, trace: str | None = None):
+    """
+    Record the enclosed block as a stage of the active profiler, if any
+    """
+    profiler = _active.get()
+    if profiler is None:
+        yield
+        return
+
+    memory = profiler._memory()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        profiler.record(name, trace, seconds, profiler._memory() - memory)
+
+
+def profiled(name: str, key: Callable | None = None):
+    """
+    Record every call of the decorated function as a stage of the active
+    profiler, if any
+
+    Args:
+        name: stage name
+        key: called with the function's arguments to name the trace the call
+            ran on, only evaluated while profiling
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profiler = _active.get()
+            if profiler is None:
+                return fn(*args, **kwargs)
+
+            trace = None if key is None else key(*args, **kwargs)
+            memory = profiler._memory()
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                profiler.record(name, trace, seconds, profiler._memory() - memory)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,192 @@
+from pathlib import Path
+
+import polars as pl
+
+from . import data_utils as du
+from . import file_utils
+from .catalog import TofCatalog
+from .constants import ExperimentIndices, OutputFormats, PeakIndices, RawIndices
+from .tof_data import Config, TofData
+
+
+class TofPeakStore:
+    """
+    Peak data of an experiment spilled to parquet part files on disk
+
+    Traces are read and processed in batches sized to a memory budget, and
+    only their peak rows are kept, so experiments far larger than memory can
+    be processed. The normalization and aggregation queries run lazily over
+    the part files with polars' streaming engine.
+    """
+
+    def __init__(self, path: str | Path, config: Config | None = None):
+        self.path = Path(path)
+        self.config = Config() if config is None else config
+
+    @classmethod
+    def from_directory(
+        cls,
+        path: str | Path,
+        store_dir: str | Path | None = None,
+        config: Config | None = None,
+        memory_budget_mb: float = 512,
+    ):
+        """
+        Process every trace file of an experiment directory into a store
+
+        Args:
+            path: experiment directory
+            store_dir: directory to write the part files to, defaults to a new
+                directory in the experiment directory
+            config: processing config, exclusions are resolved from the file
+                names before any file is read
+            memory_budget_mb: approximate memory to hold traces in at once
+
+        Returns:
+            (TofPeakStore): store of the processed peak data
+        """
+        if store_dir is None:
+            store_dir = file_utils.prepare_experiment_dir(path, name="tof_store")
+        store = cls(store_dir, config=config)
+        catalog = TofCatalog.from_directory(path).exclude(store.config.exclusions)
+        store.write(catalog.paths, memory_budget_mb=memory_budget_mb)
+        return store
+
+    @property
+    def parts_dir(self):
+        return self.path / "peak_data"
+
+    def write(self, files, memory_budget_mb: float = 512):
+        """
+        Process trace files in batches and append their peak rows as parts
+
+        The batch size is derived from the memory budget and the in-memory
+        size of the first processed trace. With a fit model the peaks of a
+        whole batch are fitted in one call before the part is written.
+        """
+        self.parts_dir.mkdir(parents=True, exist_ok=True)
+        part = len(list(self.parts_dir.glob("*.parquet")))
+        budget = memory_budget_mb * 2**20
+        fit = self.config.fit_params.model is not None
+
+        batch, batch_size = [], None
+        for f in files:
+            title, time, run = file_utils.parse_file_path(f)
+            if self.config.is_excluded(float(time), int(run)):
+                continue
+
+            td = TofData.from_file(f)
+            td.config = self.config
+            td = td.process()
+            if batch_size is None:
+                # processing holds a few copies of the raw data at once
+                trace_size = 4 * td.raw_data.estimated_size()
+                batch_size = max(1, int(budget // max(trace_size, 1)))
+
+            # the processed trace is dropped here, only its peak rows and the
+            # samples a fit needs are kept
+            if fit:
+                raw_data = td.raw_data.select(
+                    RawIndices.MZ.value, RawIndices.SIGNAL.value
+                )
+            else:
+                raw_data = td.raw_data.clear()
+            batch.append(td.copy(raw_data=raw_data))
+
+            if len(batch) >= batch_size:
+                self._write_part(batch, part)
+                batch, part = [], part + 1
+
+        if batch:
+            self._write_part(batch, part)
+
+    def _write_part(self, batch: list[TofData], part: int):
+        if self.config.fit_params.model is not None:
+            from .fitting import fit_peaks
+
+            batch = fit_peaks(batch, self.config)
+
+        peak_data = [
+            td.peak_data.with_columns(td.get_experiment_cols())
+            for td in batch
+            if not td.peak_data.is_empty()
+        ]
+        if not peak_data:
+            return
+        pl.concat(peak_data).write_parquet(
+            self.parts_dir / f"part-{part:05d}.parquet", compression="zstd"
+        )
+
+    def scan_peak_data(self) -> pl.LazyFrame:
+        return pl.scan_parquet(self.parts_dir / "*.parquet")
+
+    def get_combined_peak_data(self):
+        return self.scan_peak_data().collect(engine="streaming")
+
+    def get_normalization(self):
+        return du.get_normalization(self.scan_peak_data()).collect(engine="streaming")
+
+    def get_normalized_combined_peak_data(self):
+        return du.normalize_peak_data(self.scan_peak_data()).collect(
+            engine="streaming"
+        )
+
+    def get_aggregated_peak_data(self):
+        return du.aggregate_peak_data(
+            self.scan_peak_data(), PeakIndices.SUM.value
+        ).collect(engine="streaming")
+
+    def get_normalized_aggregated_peak_data(self):
+        return du.aggregate_peak_data(
+            du.normalize_peak_data(self.scan_peak_data()),
+            ExperimentIndices.NORM_SUM.value,
+        ).collect(engine="streaming")
+
+    def save_data(
+        self,
+        path: str | Path | None = None,
+        output_format: OutputFormats = OutputFormats.CSV,
+    ):
+        """
+        Write the peak tables and config like `TofExperimentData.save_data`,
+        in the same formats and layout. The combined peak data is streamed to
+        disk without being collected, as parquet one reaction time at a time.
+        """
+        if path is None:
+            path = self.path
+        output_dir = file_utils.prepare_experiment_dir(path)
+        file_utils.write_json(output_dir / "config.json", self.config.model_dump())
+
+        peak_data = self.scan_peak_data()
+        if output_format == OutputFormats.CSV:
+            du.normalize_peak_data(peak_data).drop(PeakIndices.MZ_SPAN.value).sink_csv(
+                output_dir / "combined_peak_data.csv"
+            )
+        elif output_format == OutputFormats.PARQUET:
+            # the `{reaction_time}={value}/` layout of `file_utils.write_table`,
+            # the normalization is per reaction time so every partition is
+            # normalized on its own
+            key = ExperimentIndices.REACTION_TIME.value
+            times = peak_data.select(pl.col(key).unique().sort()).collect()[key]
+            for t in times:
+                partition = peak_data.filter(pl.col(key) == t)
+                partition_dir = output_dir / "combined_peak_data" / f"{key}={t}"
+                partition_dir.mkdir(parents=True, exist_ok=True)
+                du.normalize_peak_data(partition).sink_parquet(
+                    partition_dir / "00000000.parquet", compression="zstd"
+                )
+        else:
+            du.normalize_peak_data(peak_data).sink_ipc(
+                output_dir / "combined_peak_data.arrow", compression="zstd"
+            )
+
+        file_utils.write_table(
+            output_dir / "aggregated_peak_data",
+            self.get_aggregated_peak_data(),
+            output_format,
+        )
+        file_utils.write_table(
+            output_dir / "normalized_aggregated_peak_data",
+            self.get_normalized_aggregated_peak_data(),
+            output_format,
+        )
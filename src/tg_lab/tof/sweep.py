@@ -0,0 +1,173 @@
+import itertools
+
+import numpy as np
+import polars as pl
+
+from . import data_utils as du
+from .constants import ExperimentIndices, PeakIndices, RawIndices
+from .tof_data import Config, PeakParams, TofData
+
+SIGMA = "sigma"
+PEAK_WIDTH = "peak_width"
+BKG_X_MIN = "bkg_x_min"
+BKG_X_MAX = "bkg_x_max"
+PARAM_COLS = [SIGMA, PEAK_WIDTH, BKG_X_MIN, BKG_X_MAX]
+
+
+class TofSweep:
+    """
+    Peak detection and integration of an experiment evaluated over a grid of
+    `PeakParams.sigma`, `PeakParams.peak_width` and `BackgroundParams` values
+
+    The traces are stacked and converted to m/z once. Each background range
+    and peak width then takes one compiled pass over all traces. Every sigma
+    reuses the peak minima and sums of that pass, because the detection
+    threshold only decides which peaks are kept. Results follow the `numba`
+    processing backend, ions without a peak below the threshold are left out.
+
+    Args:
+        data: unprocessed traces
+        config: config holding the m/z conversion, peaks and the default value
+            of every swept parameter
+    """
+
+    def __init__(self, data: list[TofData], config: Config | None = None):
+        self.config = Config() if config is None else config
+
+        by_length = {}
+        for td in data:
+            by_length.setdefault(td.raw_data.height, []).append(td)
+
+        self._groups = []
+        for traces in by_length.values():
+            tof_time = np.stack(
+                [td.raw_data[RawIndices.TOF_TIME.value].to_numpy() for td in traces]
+            ).astype(np.float64)
+            signal = np.stack(
+                [td.raw_data[RawIndices.SIGNAL.value].to_numpy() for td in traces]
+            ).astype(np.float64)
+            self._groups.append((self.config.mz_params.convert(tof_time), signal))
+
+        traces = [td for traces in by_length.values() for td in traces]
+        self._times = np.array([td.time for td in traces], dtype=np.float64)
+        self._runs = np.array([td.run for td in traces], dtype=np.int64)
+
+    @classmethod
+    def from_experiment(cls, ted):
+        """
+        Sweep over the traces of a `TofExperimentData` that are not excluded
+        """
+        ted = ted.filter_by_exclusions()
+        return cls(ted.data, ted.config)
+
+    def run(
+        self,
+        sigma: list[float] | None = None,
+        peak_width: list[float] | None = None,
+        bkg_x_min: list[float] | None = None,
+        bkg_x_max: list[float] | None = None,
+        aggregate: bool = True,
+    ) -> pl.DataFrame:
+        """
+        Evaluate every combination of the given parameter values, parameters
+        left as None keep their config value
+
+        Args:
+            sigma: detection thresholds in background standard deviations
+            peak_width: widths of the peak windows in m/z
+            bkg_x_min: lower edges of the background range in m/z
+            bkg_x_max: upper edges of the background range in m/z
+            aggregate: aggregate the peak sums per ion and reaction time like
+                `TofExperimentData.get_aggregated_peak_data`, otherwise return
+                every found peak
+
+        Returns:
+            (pl.DataFrame): long format frame with the parameter columns
+                `sigma`, `peak_width`, `bkg_x_min`, `bkg_x_max`. When
+                aggregated it also has ion, reaction time, the sum statistics
+                and the mean/std of the normalized sums
+        """
+        # imported on use so the compiled kernels are only built when needed
+        from .kernels import _sweep_traces
+
+        peak_params = self.config.peak_params
+        bkg_params = self.config.bkg_params
+        sigmas = np.array([peak_params.sigma] if sigma is None else sigma, dtype=float)
+        widths = [peak_params.peak_width] if peak_width is None else peak_width
+        x_mins = [bkg_params.x_min] if bkg_x_min is None else bkg_x_min
+        x_maxs = [bkg_params.x_max] if bkg_x_max is None else bkg_x_max
+        names = list(peak_params.peaks)
+
+        frames = []
+        for x_min, x_max in itertools.product(x_mins, x_maxs):
+            if x_min >= x_max:
+                continue
+            for width in widths:
+                ranges = PeakParams(
+                    peaks=peak_params.peaks, peak_width=width
+                ).get_peak_ranges()
+                ranges = np.array(list(ranges.values()), dtype=np.float64).reshape(
+                    -1, 2
+                )
+
+                # floats throughout, an int edge would compile another kernel
+                results = [
+                    _sweep_traces(
+                        mz,
+                        signal,
+                        float(x_min),
+                        float(x_max),
+                        ranges[:, 0],
+                        ranges[:, 1],
+                    )
+                    for mz, signal in self._groups
+                ]
+                bkg_stats = np.concatenate([r[0] for r in results])
+                values = np.concatenate([r[1] for r in results])
+                sums = np.concatenate([r[2] for r in results])
+
+                # (sigma, trace) thresholds against (trace, ion) peak minima
+                mean, std = bkg_stats[:, 0], bkg_stats[:, 1]
+                threshold = mean[None] - sigmas[:, None] * std[None]
+                found = values[None] < threshold[..., None]
+
+                s, t, p = np.nonzero(found)
+                frames.append(
+                    pl.DataFrame(
+                        {
+                            SIGMA: sigmas[s],
+                            PEAK_WIDTH: np.full(len(s), width, dtype=np.float64),
+                            BKG_X_MIN: np.full(len(s), x_min, dtype=np.float64),
+                            BKG_X_MAX: np.full(len(s), x_max, dtype=np.float64),
+                            ExperimentIndices.REACTION_TIME.value: self._times[t],
+                            ExperimentIndices.RUN.value: self._runs[t],
+                            PeakIndices.ION.value: pl.Series(
+                                [names[i] for i in p], dtype=pl.String
+                            ),
+                            PeakIndices.SUM.value: sums[t, p],
+                        }
+                    )
+                )
+
+        peaks = pl.concat(frames) if frames else pl.DataFrame()
+        if not aggregate or peaks.is_empty():
+            return peaks
+
+        keys = [
+            *PARAM_COLS,
+            PeakIndices.ION.value,
+            ExperimentIndices.REACTION_TIME.value,
+        ]
+        aggregated = du.aggregate_peak_data(
+            peaks, PeakIndices.SUM.value, by=PARAM_COLS
+        )
+        normalized = du.aggregate_peak_data(
+            du.normalize_peak_data(peaks, by=PARAM_COLS),
+            ExperimentIndices.NORM_SUM.value,
+            by=PARAM_COLS,
+        ).select(
+            *keys,
+            pl.col("mean").alias("norm_mean"),
+            pl.col("std").alias("norm_std"),
+        )
+        return aggregated.join(normalized, on=keys, how="left", maintain_order="left")
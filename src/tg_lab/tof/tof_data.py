@@ -1,9 +1,21 @@
-import matplotlib.pyplot as plt
+import concurrent.futures
+import multiprocessing
+from pathlib import Path
+
 import polars as pl
 from pydantic import BaseModel, Field
 
 from . import file_utils
-from .constants import RawIndices, PeakIndices, ExperimentIndices
+from .catalog import TofCatalog
+from .profiling import Profiler, profiled, stage
+from .constants import (
+    ExperimentIndices,
+    OutputFormats,
+    PeakIndices,
+    PeakModels,
+    ProcessingBackends,
+    RawIndices,
+)
 from . import data_utils as du
 
 
@@ -42,12 +54,30 @@ class PeakParams(BaseModel):
         return {key: (val - radius, val + radius) for key, val in self.peaks.items()}
 
 
+class FitParams(BaseModel):
+    """
+    Peak shape fitted to every found peak after integration, disabled if
+    `model` is None
+    """
+
+    model: PeakModels | None = None
+    max_iter: int = 50
+
+
 class Config(BaseModel):
 
     exclusions: dict[float, list[int]] = Field(default_factory=lambda: {0: []})
     bkg_params: BackgroundParams = Field(default_factory=BackgroundParams)
     mz_params: MZParams = Field(default_factory=MZParams)
     peak_params: PeakParams = Field(default_factory=PeakParams)
+    fit_params: FitParams = Field(default_factory=FitParams)
+
+    def is_excluded(self, time, run):
+        return time in self.exclusions and run in self.exclusions[time]
+
+
+def _trace_key(td, *args, **kwargs):
+    return f"{td.title}_{td.time}_{td.run}"
 
 
 class TofData:
@@ -60,6 +90,7 @@ class TofData:
         raw_data: pl.DataFrame,
         peak_data: pl.DataFrame | None = None,
         config: Config | None = None,
+        bkg_stats: tuple[float, float] | None = None,
     ):
         pass
         self.title = title
@@ -68,8 +99,11 @@ class TofData:
         self.raw_data = raw_data
         self.peak_data = pl.DataFrame() if peak_data is None else peak_data
         self.config = Config() if config is None else config
+        # background (mean, std) of the normalized signal, set by `find_peaks`
+        self.bkg_stats = bkg_stats
 
     @classmethod
+    @profiled("parse", key=lambda cls, path: Path(path).stem)
     def from_file(cls, path: str):
         title, time, run = file_utils.parse_file_path(path)
         data = file_utils.parse_data(path)
@@ -91,6 +125,7 @@ class TofData:
             pl.lit(self.title).alias(ExperimentIndices.TITLE.value),
         ]
 
+    @profiled("convert_to_mz", key=_trace_key)
     def convert_to_mz(self):
         data = self.raw_data.with_columns(
             self.config.mz_params.convert(
@@ -99,6 +134,7 @@ class TofData:
         )
         return self.copy(raw_data=data)
 
+    @profiled("get_bkg_stats", key=_trace_key)
     def get_bkg_stats(self):
         signal = du.filter_by_mz_range(
             self.raw_data, self.config.bkg_params.as_tuple()
@@ -107,12 +143,14 @@ class TofData:
         std = signal.std().item()
         return mean, std
 
+    @profiled("normalize_background", key=_trace_key)
     def normalize_background(self):
         mean, _ = self.get_bkg_stats()
         data = self.raw_data.with_columns(pl.col(RawIndices.SIGNAL.value) - mean)
 
-        return self.copy(raw_data=data)
+        return self.copy(raw_data=data, bkg_stats=None)
 
+    @profiled("find_peaks", key=_trace_key)
     def find_peaks(self):
         mean, std = self.get_bkg_stats()
         threshold = self.config.peak_params.get_peak_detection_threshold(
@@ -125,10 +163,11 @@ class TofData:
             peak_data.append(peak.with_columns(pl.lit(name).alias("ion")))
 
         if not peak_data:
-            return self
+            return self.copy(bkg_stats=(mean, std))
 
-        return self.copy(peak_data=pl.concat(peak_data))
+        return self.copy(peak_data=pl.concat(peak_data), bkg_stats=(mean, std))
 
+    @profiled("integrate_peaks", key=_trace_key)
     def integrate_peaks(self):
         signal = self.raw_data.get_column(RawIndices.SIGNAL.value).to_numpy()
 
@@ -151,25 +190,77 @@ class TofData:
             self.convert_to_mz().normalize_background().find_peaks().integrate_peaks()
         )
 
+    def is_processed(self, config: Config | None = None):
+        """
+        Whether `process` has already run on this trace, with `config` if given
+        """
+        if self.bkg_stats is None:
+            return False
+        return config is None or self.config == config
+
 
 class TofExperimentData:
+    """
+    Traces of an experiment, either given as a list or backed by a
+    `TofCatalog` whose files are only read once `data` is first accessed.
+    Key lookups, exclusions and reaction time selections of a catalog backed
+    experiment are resolved on the file index, before any file is read.
+    """
 
-    def __init__(self, path: str, data: list[TofData], config: Config | None = None):
+    def __init__(
+        self,
+        path: str,
+        data: list[TofData] | None = None,
+        config: Config | None = None,
+        catalog: TofCatalog | None = None,
+    ):
         self.path = path
-        self.data = data
+        self._data = data
         self.config = Config() if config is None else config
+        self.catalog = catalog
 
     @classmethod
     def from_directory(cls, path: str):
-        return cls(
-            path=path, data=[TofData.from_file(f) for f in file_utils.get_files(path)]
-        )
+        return cls(path=path, catalog=TofCatalog.from_directory(path))
+
+    @property
+    def data(self) -> list[TofData]:
+        if self._data is None:
+            self._data = [] if self.catalog is None else self.catalog.load()
+        return self._data
+
+    @data.setter
+    def data(self, data: list[TofData]):
+        self._data = data
+
+    def is_loaded(self):
+        return self._data is not None
 
     def copy(self, **kwargs):
-        d = {**self.__dict__, **kwargs}
+        d = {
+            "path": self.path,
+            "data": self._data,
+            "config": self.config,
+            "catalog": self.catalog,
+            **kwargs,
+        }
         return type(self)(**d)
 
+    def select(self, t: float | int | list[float]):
+        """
+        Experiment of the traces at the reaction time(s) `t`, a catalog backed
+        experiment that is not loaded yet only reads the selected files
+        """
+        if not self.is_loaded() and self.catalog is not None:
+            return self.copy(catalog=self.catalog.select(t=t))
+
+        times = t if isinstance(t, list) else [t]
+        return self.copy(data=[td for td in self.data if td.time in times])
+
     def get_keys(self):
+        if not self.is_loaded() and self.catalog is not None:
+            return self.catalog.get_keys()
+
         keys = {}
         for td in self.data:
             keys[td.time] = keys.get(td.time, [])
@@ -181,24 +272,65 @@ class TofExperimentData:
         return keys
 
     def filter_by_exclusions(self):
+        if not self.is_loaded() and self.catalog is not None:
+            return self.copy(catalog=self.catalog.exclude(self.config.exclusions))
+
         data = []
         for td in self.data:
-            if (
-                td.time in self.config.exclusions
-                and td.run in self.config.exclusions[td.time]
-            ):
+            if self.config.is_excluded(td.time, td.run):
                 continue
             data.append(td)
         return self.copy(data=data)
 
-    def process(self):
+    @profiled("process")
+    def process(self, backend: ProcessingBackends = ProcessingBackends.POLARS):
+        """
+        Process every trace that is not excluded
+
+        Args:
+            backend: `polars` runs `TofData.process` per trace, `numba` runs
+                the whole chain for all traces in one compiled parallel pass
+        """
         ted = self.filter_by_exclusions()
-        data = []
-        for td in ted.data:
-            td.config = self.config
-            data.append(td.process())
+        if backend == ProcessingBackends.NUMBA:
+            # imported on use so the compiled kernels are only built when needed
+            from .kernels import process_traces
+
+            with stage("process_traces"):
+                data = process_traces(ted.data, self.config)
+        else:
+            data = []
+            for td in ted.data:
+                td.config = self.config
+                data.append(td.process())
+
+        if self.config.fit_params.model is not None:
+            from .fitting import fit_peaks
+
+            with stage("fit_peaks"):
+                data = fit_peaks(data, self.config)
+
         return self.copy(data=data)
 
+    def sweep(
+        self,
+        sigma: list[float] | None = None,
+        peak_width: list[float] | None = None,
+        bkg_x_min: list[float] | None = None,
+        bkg_x_max: list[float] | None = None,
+    ) -> pl.DataFrame:
+        """
+        Aggregated peak sums for every combination of the given parameter
+        values in a single pass over the traces, see `sweep.TofSweep`
+        """
+        # imported on use so the compiled kernels are only built when needed
+        from .sweep import TofSweep
+
+        return TofSweep.from_experiment(self).run(
+            sigma=sigma, peak_width=peak_width, bkg_x_min=bkg_x_min, bkg_x_max=bkg_x_max
+        )
+
+    @profiled("concat")
     def get_combined_raw_data(self):
         combined = []
         for td in self.data:
@@ -206,6 +338,7 @@ class TofExperimentData:
 
         return pl.concat(combined)
 
+    @profiled("concat")
     def get_combined_peak_data(self):
         combined = []
         for td in self.data:
@@ -213,84 +346,158 @@ class TofExperimentData:
 
         return pl.concat(combined)
 
+    @profiled("normalization")
     def get_normalization(self):
-        peak_data: pl.DataFrame = self.get_combined_peak_data()
-        return peak_data.group_by(
-            [ExperimentIndices.REACTION_TIME.value, RawIndices.RUN.value]
-        ).agg(pl.col(PeakIndices.SUM.value).sum().alias(ExperimentIndices.NORM.value))
+        return du.get_normalization(self.get_combined_peak_data())
 
+    @profiled("normalization")
     def get_normalized_combined_peak_data(self):
-        norm = self.get_normalization()
-        return self.get_combined_peak_data().join(
-            norm, [ExperimentIndices.REACTION_TIME.value, RawIndices.RUN.value]
-        ).with_columns(
-            (
-                pl.col(PeakIndices.SUM.value)
-                / pl.col(ExperimentIndices.NORM.value)
-            ).alias(ExperimentIndices.NORM_SUM.value)
-        )
+        return du.normalize_peak_data(self.get_combined_peak_data())
 
+    @profiled("aggregation")
     def get_aggregated_peak_data(self):
-        group_by_cols = [PeakIndices.ION.value, ExperimentIndices.REACTION_TIME.value]
-        agg_col = pl.col(PeakIndices.SUM.value)
-        return (
-            self.get_combined_peak_data()
-            .group_by(group_by_cols)
-            .agg(
-                agg_col.mean().alias("mean"),
-                agg_col.std().alias("std"),
-                agg_col.sum().alias("sum"),
-                agg_col.count().alias("count")
-            )
-            .sort(group_by_cols)
+        return du.aggregate_peak_data(
+            self.get_combined_peak_data(), PeakIndices.SUM.value
         )
-    
+
+    @profiled("aggregation")
     def get_normalized_aggregated_peak_data(self):
-        group_by_cols = [PeakIndices.ION.value, ExperimentIndices.REACTION_TIME.value]
-        agg_col = pl.col(ExperimentIndices.NORM_SUM.value)
-        return (
-            self.get_normalized_combined_peak_data()
-            .group_by(group_by_cols)
-            .agg(
-                agg_col.mean().alias("mean"),
-                agg_col.std().alias("std"),
-                agg_col.sum().alias("sum"),
-                agg_col.count().alias("count")
-            )
-            .sort(group_by_cols)
+        return du.aggregate_peak_data(
+            self.get_normalized_combined_peak_data(),
+            ExperimentIndices.NORM_SUM.value,
         )
 
-    def plot_raw(self, xlim=None, ylim=None, t: float | int | None = None):
-        plotter = TofPlotter()
+    def _get_processed(self, t: float | int | None = None):
         ted = self.filter_by_exclusions()
-
-        data = ted.data
         if t is not None:
-            data = [td for td in ted.data if td.time == t]
-        for td in data:
-            td.config = self.config
+            ted = ted.select(t)
+
+        processed = []
+        for td in ted.data:
+            if not td.is_processed(self.config):
+                td.config = self.config
+                td = td.process()
+            processed.append(td)
+        return processed
+
+    def plot_raw(self, xlim=None, ylim=None, t: float | int | None = None):
+        plotter = TofPlotter()
+        for td in self._get_processed(t=t):
             fig, ax = plotter.plot_raw(
-                td=td.process(),
+                td=td,
                 xlim=xlim,
                 ylim=ylim,
             )
 
-    def save_data(self, path: str | None = None):
+    def export_raw_plots(
+        self,
+        path: str | None = None,
+        xlim: tuple[float] | None = None,
+        ylim: tuple[float] | None = None,
+        t: float | int | None = None,
+        size: tuple[int, int] = (1600, 900),
+        dpi: int = 100,
+        workers: int | None = None,
+    ):
+        """
+        Render the raw plot of every trace straight to png files
+
+        Traces are processed only if they have not been processed with the
+        current config yet, and the rendering runs in a process pool with
+        matplotlib's non-interactive Agg canvas. Lines are min/max decimated
+        to the pixel width of the image.
+
+        Args:
+            path: directory to create the plot directory in, defaults to the
+                experiment directory
+            xlim: m/z limits of the plots
+            ylim: signal limits of the plots
+            t: only export the traces of this reaction time
+            size: (width, height) of the images in pixels
+            dpi: resolution of the images
+            workers: number of worker processes, defaults to every core
+
+        Returns:
+            (list[Path]): paths of the written images
+        """
+        if path is None:
+            path = self.path
+        output_dir = file_utils.prepare_experiment_dir(path, name="raw_plots")
+
+        tasks = [
+            (
+                td,
+                output_dir / f"{td.title}_{td.time}_{td.run}.png",
+                xlim,
+                ylim,
+                size,
+                dpi,
+            )
+            for td in self._get_processed(t=t)
+        ]
+        if not tasks:
+            return []
+
+        # forking after polars has started its thread pool can deadlock
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(workers, context) as executor:
+            return list(executor.map(_export_raw_plot, *zip(*tasks)))
+
+    def save_data(
+        self,
+        path: str | None = None,
+        output_format: OutputFormats = OutputFormats.CSV,
+        profile: bool = False,
+    ):
+        """
+        Process the experiment and write the peak tables and config
+
+        Args:
+            path: directory to create the output directory in, defaults to the
+                experiment directory
+            output_format: `csv` drops the `m/z_span` list column. `parquet`
+                keeps every column, writes zstd compressed files and partitions
+                the combined peak data by reaction time, so it can be read
+                with `pl.scan_parquet(..., hive_partitioning=True)`. `ipc`
+                writes zstd compressed Arrow IPC files.
+            profile: profile the processing and writing stages, print the
+                summary and write `profile.json` and `profile_summary.csv` to
+                the output directory, see `profiling.Profiler`
+        """
         if path is None:
             path = self.path
         output_dir = file_utils.prepare_experiment_dir(path)
+
+        if profile:
+            with Profiler() as profiler:
+                self._write_data(output_dir, output_format)
+            with pl.Config(tbl_rows=-1, fmt_str_lengths=64):
+                print(profiler.summary())
+            profiler.save(output_dir)
+        else:
+            self._write_data(output_dir, output_format)
+
+    def _write_data(self, output_dir: Path, output_format: OutputFormats):
         ted = self.process()
         file_utils.write_json(output_dir / "config.json", self.get_config())
-        # drop MZ_SPAN because it's a tuple and csv's cannot handle that structure
-        ted.get_normalized_combined_peak_data().drop(PeakIndices.MZ_SPAN.value).write_csv(
-            output_dir / "combined_peak_data.csv"
-        )
-        ted.get_aggregated_peak_data().write_csv(
-            output_dir / "aggregated_peak_data.csv"
-        )
-        ted.get_normalized_aggregated_peak_data().write_csv(
-            output_dir / "normalized_aggregated_peak_data.csv"
-        )
+
+        tables = {
+            "combined_peak_data": ted.get_normalized_combined_peak_data(),
+            "aggregated_peak_data": ted.get_aggregated_peak_data(),
+            "normalized_aggregated_peak_data": ted.get_normalized_aggregated_peak_data(),
+        }
+        for name, table in tables.items():
+            with stage(f"write_{name}"):
+                file_utils.write_table(
+                    output_dir / name,
+                    table,
+                    output_format,
+                    partition_by=(
+                        ExperimentIndices.REACTION_TIME.value
+                        if name == "combined_peak_data"
+                        else None
+                    ),
+                )
 
     def print_config(self):
         return self.config.model_dump_json(indent=4)
@@ -316,7 +523,7 @@ class TofPlotter:
         )
 
     def _plot_peak_threshold(self, ax, td):
-        mean, std = td.get_bkg_stats()
+        mean, std = td.bkg_stats if td.bkg_stats is not None else td.get_bkg_stats()
         threshold = td.config.peak_params.get_peak_detection_threshold(
             mean=mean, std=std
         )
@@ -376,18 +583,23 @@ class TofPlotter:
                 label=label,
             )
 
-    def plot_raw(
+    def draw_raw(
         self,
+        ax,
         td: TofData,
         xlim: tuple[float] | None = None,
         ylim: tuple[float] | None = None,
+        line: tuple | None = None,
     ):
         x = RawIndices.MZ.value
         y = RawIndices.SIGNAL.value
 
-        fig, ax = plt.subplots()
+        # every sample is drawn unless a reduced line is given, so panning
+        # and zooming an interactive plot shows the whole trace
+        if line is None:
+            line = td.raw_data[x], td.raw_data[y]
 
-        ax.plot(td.raw_data[x], td.raw_data[y], color="k", linewidth=0.5)
+        ax.plot(*line, color="k", linewidth=0.5)
         ax.set_xlim(xlim)
         ax.set_ylim(ylim)
         ax.set(xlabel=x, ylabel=y)
@@ -400,4 +612,41 @@ class TofPlotter:
 
         ax.legend(bbox_to_anchor=(1, 1), loc="upper left")
 
+    def plot_raw(
+        self,
+        td: TofData,
+        xlim: tuple[float] | None = None,
+        ylim: tuple[float] | None = None,
+    ):
+        # imported on use so headless processing does not load matplotlib
+        import matplotlib.pyplot as plt
+
+        fig, ax = plt.subplots()
+        self.draw_raw(ax=ax, td=td, xlim=xlim, ylim=ylim)
+
         return fig, ax
+
+
+def _export_raw_plot(td, path, xlim, ylim, size, dpi):
+    # a bare Figure renders through the Agg canvas without touching pyplot or
+    # an interactive backend
+    from matplotlib.figure import Figure
+
+    width, height = size
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    ax = fig.add_subplot()
+
+    # a static image only needs the samples inside xlim, reduced to the
+    # min/max of every pixel column
+    data = td.raw_data
+    if xlim is not None:
+        data = du.filter_by_mz_range(data, xlim)
+    line = du.decimate_minmax(
+        data[RawIndices.MZ.value].to_numpy(),
+        data[RawIndices.SIGNAL.value].to_numpy(),
+        width,
+        xlim=xlim,
+    )
+    TofPlotter().draw_raw(ax=ax, td=td, xlim=xlim, ylim=ylim, line=line)
+    fig.savefig(path, bbox_inches="tight")
+    return path
@@ -0,0 +1,108 @@
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+import tg_lab.ion_integration.compute as ipc
+from tg_lab.ion_integration.cache import ResultCache
+from tg_lab.ion_integration.cli import (
+    IntegrationConfig,
+    entry_point,
+    get_output_paths,
+    make_blobs_key,
+)
+
+
+def write_image(path: Path, center: tuple[int, int]):
+    rows, cols = np.mgrid[:48, :64]
+    spot = 100 * np.exp(-((rows - center[0]) ** 2 + (cols - center[1]) ** 2) / 8)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savetxt(path, spot + 1, delimiter=",")
+
+
+def test_output_paths_of_same_named_files(tmp_path):
+    files = [
+        tmp_path / "run1" / "event_count.csv",
+        tmp_path / "run2" / "event_count.csv",
+    ]
+    out = tmp_path / "out" / "ion-signals.csv"
+
+    assert get_output_paths(files, out) == [
+        tmp_path / "out" / "ion-signals_run1_event_count.csv",
+        tmp_path / "out" / "ion-signals_run2_event_count.csv",
+    ]
+
+
+def test_output_paths_of_same_stems_are_numbered(tmp_path):
+    files = [tmp_path / "image.csv", tmp_path / "image.npy", tmp_path / "other.csv"]
+    names = [p.name for p in get_output_paths(files, tmp_path / "res")]
+
+    assert names == ["res_image_1.csv", "res_image_2.csv", "res_other.csv"]
+
+
+def test_per_file_outputs_of_same_named_files(tmp_path):
+    write_image(tmp_path / "data" / "run1" / "event_count.csv", (20, 20))
+    write_image(tmp_path / "data" / "run2" / "event_count.csv", (30, 40))
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+
+    entry_point(
+        IntegrationConfig(
+            input_file=str(tmp_path / "data" / "**" / "event_count.csv"),
+            output_dir=str(out_dir),
+            output_target="ion-signals.csv",
+            integration_fns=["box"],
+            per_file_outputs=True,
+            workers=1,
+        )
+    )
+
+    outputs = sorted(p.name for p in out_dir.iterdir())
+    assert outputs == [
+        "ion-signals.csv",
+        "ion-signals_run1_event_count.csv",
+        "ion-signals_run2_event_count.csv",
+    ]
+    run1 = pl.read_csv(out_dir / "ion-signals_run1_event_count.csv")
+    run2 = pl.read_csv(out_dir / "ion-signals_run2_event_count.csv")
+    assert (run1["row"][0], run1["col"][0]) != (run2["row"][0], run2["col"][0])
+
+
+def make_config(tmp_path: Path, **kwargs) -> IntegrationConfig:
+    return IntegrationConfig(
+        input_file=str(tmp_path / "data"),
+        output_dir=str(tmp_path),
+        output_target="ion-signals",
+        integration_fns=["box"],
+        workers=1,
+        **kwargs,
+    )
+
+
+def test_blobs_key_depends_on_delimiter(tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+    keys = {
+        make_blobs_key(cache, ["hash"], make_config(tmp_path, delimiter=delimiter))
+        for delimiter in [",", ";"]
+    }
+    assert len(keys) == 2
+
+
+def test_detect_once_uses_cache_dir(tmp_path, monkeypatch):
+    write_image(tmp_path / "data" / "a.csv", (20, 20))
+    write_image(tmp_path / "data" / "b.csv", (20, 21))
+    cache_dir = tmp_path / "cache"
+    config = make_config(tmp_path, detect_once=True, cache_dir=str(cache_dir))
+
+    entry_point(config)
+    first = pl.read_csv(tmp_path / "ion-signals.csv")
+    entries = sorted(p.name for p in cache_dir.glob("blobs-*.npy"))
+    assert len(entries) == 1
+
+    def detect_blobs(*args, **kwargs):
+        raise AssertionError("ions detected again despite the cache")
+
+    monkeypatch.setattr(ipc, "detect_blobs", detect_blobs)
+    entry_point(config)
+    assert sorted(p.name for p in cache_dir.glob("blobs-*.npy")) == entries
+    assert pl.read_csv(tmp_path / "ion-signals.csv").equals(first)
@@ -0,0 +1,91 @@
+from functools import partial
+
+import numpy as np
+import pytest
+
+import tg_lab.ion_integration.compute as ipc
+
+per_blob = {
+    ipc.IntegrationFns.BOX: ipc._integrate_box,
+    ipc.IntegrationFns.L1: partial(ipc._integrate_norm, ord=1),
+    ipc.IntegrationFns.L2: partial(ipc._integrate_norm, ord=2),
+}
+
+
+@pytest.fixture
+def image():
+    rng = np.random.default_rng(0)
+    return rng.poisson(3, (120, 160)).astype(np.float64)
+
+
+@pytest.fixture
+def blobs():
+    # centers on and next to every edge as well as inside the image
+    rng = np.random.default_rng(1)
+    inside = np.column_stack(
+        [rng.uniform(0, 119, 40), rng.uniform(0, 159, 40), rng.uniform(1, 12, 40)]
+    )
+    edges = np.array([[0, 0, 5], [119, 159, 7], [3, 80, 6], [60, 158, 9]])
+    return np.vstack([inside, edges])
+
+
+@pytest.mark.parametrize("fn", list(ipc.IntegrationFns))
+def test_integrate_blobs_matches_per_blob(image, blobs, fn):
+    res = ipc.integrate_blobs(image, blobs, [fn])
+    expected = [per_blob[fn](image, int(row), int(col), r) for row, col, r in blobs]
+    np.testing.assert_allclose(res[f"{fn}_sum"].to_numpy(), expected)
+
+
+@pytest.mark.parametrize("table", [True, False])
+def test_box_and_annulus_with_and_without_table(image, blobs, table):
+    rows, cols, radii = blobs[:, 0].astype(int), blobs[:, 1].astype(int), blobs[:, 2]
+    integral = ipc._integral_image(image) if table else None
+
+    box = ipc._batch_integrate_box(image, integral, rows, cols, radii)
+    bkg_sum, bkg_area = ipc._batch_integrate_annulus(
+        image, integral, rows, cols, radii, 3
+    )
+
+    r = np.ceil(radii)
+    inner = [ipc._integrate_box(image, a, b, c) for a, b, c in zip(rows, cols, r)]
+    outer = [ipc._integrate_box(image, a, b, c + 3) for a, b, c in zip(rows, cols, r)]
+    np.testing.assert_allclose(box, inner)
+    np.testing.assert_allclose(bkg_sum, np.subtract(outer, inner))
+    assert np.all(bkg_area > 0)
+
+
+def test_table_only_for_many_blobs():
+    shape = (1080, 1440)
+    assert not ipc._table_pays_off(shape, np.full(50, 8.0), True, None)
+    assert ipc._table_pays_off(shape, np.full(5000, 8.0), True, 4)
+
+
+def spots(centers: list[tuple[int, int]], sigma: float = 3, shape=(64, 96)):
+    rows, cols = np.mgrid[: shape[0], : shape[1]]
+    image = np.zeros(shape)
+    for row, col in centers:
+        image += 100 * np.exp(-((rows - row) ** 2 + (cols - col) ** 2) / (2 * sigma**2))
+    return image
+
+
+@pytest.mark.parametrize("spacing", [10, 20])
+def test_refined_blobs_of_close_ions_stay_distinct(spacing):
+    centers = np.array([(32, 40), (32, 40 + spacing)])
+    blobs = ipc.detect_blobs(spots(centers), downsample=4, max_sigma=10)
+
+    assert len(blobs) == 2
+    assert len(np.unique(blobs[:, :2], axis=0)) == 2
+    # every ion keeps its own blob
+    dist = np.hypot(*(blobs[:, None, :2] - centers[None]).transpose(2, 0, 1))
+    assert sorted(dist.argmin(axis=0)) == [0, 1]
+
+
+def test_refined_blobs_match_full_resolution():
+    image = spots([(32, 40), (32, 60)])
+    full = ipc.detect_blobs(image, max_sigma=10)
+    refined = ipc.detect_blobs(image, downsample=4, max_sigma=10)
+
+    def order(blobs):
+        return blobs[np.argsort(blobs[:, 1]), :2]
+
+    np.testing.assert_allclose(order(refined), order(full))
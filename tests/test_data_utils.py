@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from tg_lab.tof import data_utils as du
+
+
+@pytest.mark.parametrize("xlim", [None, (20.0, 80.0)])
+def test_decimate_minmax_matches_per_pixel_extremes(xlim):
+    rng = np.random.default_rng(0)
+    # m/z grows with the square of the time of flight
+    x = np.linspace(1, 10, 5000) ** 2
+    y = rng.normal(size=x.size)
+    if xlim is not None:
+        inside = (x >= xlim[0]) & (x <= xlim[1])
+        x, y = x[inside], y[inside]
+    n_bins = 100
+
+    dx, dy = du.decimate_minmax(x, y, n_bins, xlim=xlim)
+
+    x0, x1 = (x.min(), x.max()) if xlim is None else xlim
+    edges = np.linspace(x0, x1, n_bins + 1)
+    assert np.all(np.diff(dx) > 0)
+
+    def column(values, i):
+        # the right edge belongs to the last column
+        if i == n_bins - 1:
+            return (values >= edges[i]) & (values <= edges[i + 1])
+        return (values >= edges[i]) & (values < edges[i + 1])
+
+    for i in range(n_bins):
+        in_column, kept = column(x, i), column(dx, i)
+        if not in_column.any():
+            assert not kept.any()
+            continue
+        assert sorted(dy[kept]) == sorted({y[in_column].min(), y[in_column].max()})
+
+
+def test_decimate_minmax_keeps_short_lines():
+    x, y = np.arange(10.0), np.arange(10.0)
+    dx, dy = du.decimate_minmax(x, y, 10)
+    np.testing.assert_array_equal(dx, x)
@@ -0,0 +1,29 @@
+import numpy as np
+
+from tg_lab.ion_event_counting.fastvimprocess import event_centroiding
+
+
+def test_centroiding_without_positive_weights():
+    # with a zero threshold every pixel of a blank image is a peak
+    image = np.zeros((6, 6), dtype=np.int64)
+    out = np.zeros((12, 12))
+
+    count = event_centroiding(image, 0, 0, 3, 1, 0, 2, out)
+
+    assert count == 16
+    assert np.isfinite(out).all()
+    # events stay at the center of their peak pixel
+    rows, cols = np.nonzero(out)
+    assert set(rows) == set(cols) == {3, 5, 7, 9}
+
+
+def test_centroiding_between_pixels():
+    image = np.zeros((6, 6), dtype=np.int64)
+    image[2, 2] = image[2, 3] = 100
+    out = np.zeros((12, 12))
+
+    count = event_centroiding(image, 50, 0, 3, 1, 0, 2, out)
+
+    # both pixels are peaks, their centroid lies on the shared edge
+    assert count == 2
+    assert out[5, 6] == 2
@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+
+# dependencies that must only be loaded by the code paths that use them
+HEAVY_MODULES = ["matplotlib", "numba", "imagingcontrol4", "skimage", "scipy"]
+
+
+def run_python(code: str) -> str:
+    """
+    Run `code` in a fresh interpreter with the source tree importable
+    """
+    env = {**os.environ, "PYTHONPATH": str(SRC)}
+    res = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    return res.stdout.splitlines()[-1]
+
+
+def loaded_modules(module: str) -> set[str]:
+    code = (
+        f"import json, sys, {module}\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    return set(json.loads(run_python(code)))
+
+
+@pytest.mark.parametrize(
+    "module",
+    ["tg_lab", "tg_lab.tof", "tg_lab.ion_integration", "tg_lab.ion_integration.cli"],
+)
+def test_import_does_not_load_heavy_dependencies(module):
+    assert loaded_modules(module) == set()
+
+
+def test_kernels_do_load_numba():
+    # guards the check above against passing vacuously
+    assert "numba" in loaded_modules("tg_lab.tof.kernels")
+
+
+def test_subpackages_load_lazily():
+    assert run_python("import sys, tg_lab; print('tg_lab.tof' in sys.modules)") == "False"
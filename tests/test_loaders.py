@@ -0,0 +1,30 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from tg_lab.ion_integration.loaders import read_text_matrix
+
+
+@pytest.fixture(params=[1, 4], ids=["numpy", "polars"])
+def threads(request, monkeypatch):
+    # the polars reader is only used with more than one thread available
+    monkeypatch.setattr(pl, "thread_pool_size", lambda: request.param)
+    return request.param
+
+
+def test_read_text_matrix_with_late_floats(tmp_path, threads):
+    data = np.ones((300, 4))
+    data[250, 2] = 1.5
+    path = tmp_path / "image.csv"
+    np.savetxt(path, data, delimiter=",", fmt="%g")
+
+    np.testing.assert_array_equal(read_text_matrix(path), data)
+
+
+def test_read_text_matrix_matches_loadtxt(tmp_path, threads):
+    path = tmp_path / "image.csv"
+    path.write_text("1; 2.5;-3\n 4e2;5;6\n")
+
+    res = read_text_matrix(path, delimiter=";")
+    np.testing.assert_array_equal(res, np.loadtxt(path, delimiter=";"))
+    assert res.dtype == np.float64
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import tg_lab.ion_integration.compute as ipc
+from tg_lab.ion_integration.monitor import IonTracker, MonitorConfig, evaluate
+from tg_lab.shared_image import SharedImage
+
+
+def test_tracker_keeps_indices_of_moved_and_reordered_ions():
+    tracker = IonTracker()
+    first = np.array([[10, 10, 4], [10, 50, 4], [40, 30, 4]])
+    assert tracker.assign(first).tolist() == [0, 1, 2]
+
+    # reordered, slightly moved, one ion missing and a new one in front
+    second = np.array([[60, 60, 4], [41, 29, 4], [11, 10, 4]])
+    assert tracker.assign(second).tolist() == [3, 2, 0]
+
+    # the missing ion is matched again at its last known position
+    assert tracker.assign(first).tolist() == [0, 1, 2]
+
+
+def test_tracker_matches_each_ion_once():
+    tracker = IonTracker()
+    tracker.assign(np.array([[10, 10, 4]]))
+    # two detections near one known ion, the closer one takes its index
+    assert tracker.assign(np.array([[12, 10, 4], [11, 10, 4]])).tolist() == [1, 0]
+
+
+def spot(shape, row, col, sigma=3):
+    rows, cols = np.mgrid[: shape[0], : shape[1]]
+    return 100 * np.exp(-((rows - row) ** 2 + (cols - col) ** 2) / (2 * sigma**2))
+
+
+@pytest.fixture
+def shared():
+    image = SharedImage.create((64, 96))
+    yield image
+    image.close()
+
+
+def test_evaluate_keeps_ion_indices_when_ions_appear(shared):
+    config = MonitorConfig(
+        source="", output_file="", integration_fns=["box"], max_sigma=10
+    )
+    tracker = IonTracker()
+
+    shared.array[:] = spot(shared.shape, 40, 60) + spot(shared.shape, 40, 20)
+    first = evaluate(shared, config, tracker=tracker)
+
+    # a new ion detected before the others must not shift their indices
+    shared.array[:] += spot(shared.shape, 10, 40)
+    second = evaluate(shared, config, tracker=tracker)
+
+    assert first["ion"].to_list() == [0, 1]
+    assert second["ion"].to_list() == [0, 1, 2]
+    assert second.head(2).select("row", "col").equals(first.select("row", "col"))
+
+
+def test_evaluate_retries_only_the_integration(shared, monkeypatch):
+    config = MonitorConfig(
+        source="", output_file="", integration_fns=["box"], max_sigma=10, retries=3
+    )
+    shared.array[:] = spot(shared.shape, 40, 60)
+    calls = {"detect": 0, "integrate": 0}
+
+    def count(name, fn):
+        def wrapped(*args, **kwargs):
+            calls[name] += 1
+            return fn(*args, **kwargs)
+
+        return wrapped
+
+    monkeypatch.setattr(ipc, "detect_blobs", count("detect", ipc.detect_blobs))
+    monkeypatch.setattr(ipc, "integrate_blobs", count("integrate", ipc.integrate_blobs))
+    # a frame is written during every attempt
+    monkeypatch.setattr(shared, "is_stable", lambda sequence: False)
+
+    res = evaluate(shared, config)
+
+    assert calls == {"detect": 1, "integrate": 4}
+    assert not res["stable"][0]